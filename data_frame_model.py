@@ -1,18 +1,120 @@
+from collections import OrderedDict
+
 from qgis.PyQt import QtCore
+import numpy as np
 import pandas as pd
 
 
 class DataFrameModel(QtCore.QAbstractTableModel):
+    """Table model for large DataFrames.
+
+    Each column is held as a NumPy array (categoricals as codes into their
+    categories) and cells are looked up by position, so no row Series is built
+    per cell. Display strings are formatted a block of rows at a time and kept
+    for the most recently viewed blocks. Rows are handed to the view in
+    batches through canFetchMore/fetchMore.
+
+    Sorting and filtering are done on the whole columns with NumPy/pandas and
+    only change the permutation of DataFrame rows that the view shows, so
+    neither needs a QSortFilterProxyModel.
+    """
+
     DtypeRole = QtCore.Qt.UserRole + 1000
     ValueRole = QtCore.Qt.UserRole + 1001
 
+    # number of rows added to the view by each fetchMore
+    FETCH_SIZE = 10000
+    # number of rows formatted together, and number of blocks kept formatted
+    BLOCK_SIZE = 256
+    MAX_BLOCKS = 256
+
     def __init__(self, df=pd.DataFrame(), parent=None):
         super(DataFrameModel, self).__init__(parent)
-        self._dataframe = df
+        self._set_arrays(df)
+
+    def _set_arrays(self, dataframe):
+        self._dataframe = dataframe
+        self._index = dataframe.index.to_numpy()
+        self._columns = []
+        for column in dataframe.columns:
+            series = dataframe[column]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                categories = series.cat.categories.to_numpy()
+                # code -1 is a missing value, which indexes the trailing "nan"
+                strings = np.append(categories.astype(str), "nan")
+                self._columns.append((series.cat.codes.to_numpy(), categories, strings))
+            else:
+                self._columns.append((series.to_numpy(), None, None))
+        self._filter = ""
+        self._filtered_rows = np.arange(len(self._index))
+        self._sort_column = None
+        self._sort_order = QtCore.Qt.AscendingOrder
+        self._set_rows(self._filtered_rows)
+
+    def _set_rows(self, rows):
+        """Set the DataFrame positions of the rows shown, in the order shown."""
+        self._rows = rows
+        self._loaded_rows = min(len(self._rows), self.FETCH_SIZE)
+        self._display_cache = OrderedDict()
+
+    def _sorted_rows(self):
+        """The filtered rows ordered by the sort column, if there is one."""
+        rows = self._filtered_rows
+        if self._sort_column is None:
+            return rows
+        # categories are sorted, so categoricals are sorted by their codes
+        values = self._columns[self._sort_column][0][rows]
+        if self._sort_order == QtCore.Qt.DescendingOrder:
+            # sort the reversed values, so equal values keep their original order
+            order = len(values) - 1 - np.argsort(values[::-1], kind="stable")[::-1]
+        else:
+            order = np.argsort(values, kind="stable")
+        return rows[order]
+
+    def sort(self, column, order=QtCore.Qt.AscendingOrder):
+        self.beginResetModel()
+        self._sort_column = column if column >= 0 else None
+        self._sort_order = order
+        self._set_rows(self._sorted_rows())
+        self.endResetModel()
+
+    def setFilter(self, expression):
+        """Show only the rows matching a pandas expression.
+
+        Args:
+            expression (str): expression evaluated with DataFrame.eval, e.g.
+                "aep == 1 and dur == 60 and variable == 'out'". An empty
+                string shows every row.
+
+        Raises:
+            ValueError: if the expression doesn't give a True/False per row.
+        """
+        expression = expression.strip()
+        if expression:
+            mask = self._dataframe.eval(expression)
+            if not (
+                isinstance(mask, pd.Series)
+                and pd.api.types.is_bool_dtype(mask)
+                and len(mask) == len(self._index)
+            ):
+                raise ValueError(
+                    "Filter must give True or False for each row: {}".format(expression)
+                )
+            filtered_rows = np.flatnonzero(mask.to_numpy())
+        else:
+            filtered_rows = np.arange(len(self._index))
+        self.beginResetModel()
+        self._filter = expression
+        self._filtered_rows = filtered_rows
+        self._set_rows(self._sorted_rows())
+        self.endResetModel()
+
+    def filter(self):
+        return self._filter
 
     def setDataFrame(self, dataframe):
         self.beginResetModel()
-        self._dataframe = dataframe.copy()
+        self._set_arrays(dataframe)
         self.endResetModel()
 
     def dataFrame(self):
@@ -29,20 +131,63 @@ class DataFrameModel(QtCore.QAbstractTableModel):
     ):
         if role == QtCore.Qt.DisplayRole:
             if orientation == QtCore.Qt.Horizontal:
-                return self._dataframe.columns[section]
+                return str(self._dataframe.columns[section])
             else:
-                return str(self._dataframe.index[section])
+                return str(self._index[self._rows[section]])
         return QtCore.QVariant()
 
     def rowCount(self, parent=QtCore.QModelIndex()):
         if parent.isValid():
             return 0
-        return len(self._dataframe.index)
+        return self._loaded_rows
 
     def columnCount(self, parent=QtCore.QModelIndex()):
         if parent.isValid():
             return 0
-        return self._dataframe.columns.size
+        return len(self._columns)
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return False
+        return self._loaded_rows < len(self._rows)
+
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return
+        rows = min(len(self._rows) - self._loaded_rows, self.FETCH_SIZE)
+        if rows <= 0:
+            return
+        self.beginInsertRows(
+            QtCore.QModelIndex(), self._loaded_rows, self._loaded_rows + rows - 1
+        )
+        self._loaded_rows += rows
+        self.endInsertRows()
+
+    def _value(self, row, column):
+        values, categories, _ = self._columns[column]
+        row = self._rows[row]
+        if categories is not None:
+            return categories[values[row]] if values[row] >= 0 else None
+        return values[row]
+
+    def _display(self, row, column):
+        """Display string of a cell, formatting its block of rows if needed."""
+        key = (column, row // self.BLOCK_SIZE)
+        block = self._display_cache.get(key)
+        if block is None:
+            start = key[1] * self.BLOCK_SIZE
+            values, categories, strings = self._columns[column]
+            values = values[self._rows[start : start + self.BLOCK_SIZE]]
+            if categories is not None:
+                block = strings[values].tolist()
+            else:
+                block = [str(value) for value in values]
+            self._display_cache[key] = block
+            if len(self._display_cache) > self.MAX_BLOCKS:
+                self._display_cache.popitem(last=False)
+        else:
+            self._display_cache.move_to_end(key)
+        return block[row % self.BLOCK_SIZE]
 
     def data(self, index, role=QtCore.Qt.DisplayRole):
         if not index.isValid() or not (
@@ -50,17 +195,15 @@ class DataFrameModel(QtCore.QAbstractTableModel):
             and 0 <= index.column() < self.columnCount()
         ):
             return QtCore.QVariant()
-        row = self._dataframe.index[index.row()]
-        col = self._dataframe.columns[index.column()]
-        dt = self._dataframe[col].dtype
+        row = index.row()
+        col = index.column()
 
-        val = self._dataframe.iloc[row][col]
         if role == QtCore.Qt.DisplayRole:
-            return str(val)
+            return self._display(row, col)
         elif role == DataFrameModel.ValueRole:
-            return val
+            return self._value(row, col)
         if role == DataFrameModel.DtypeRole:
-            return dt
+            return self._dataframe.dtypes.iloc[col]
         return QtCore.QVariant()
 
     def roleNames(self):
@@ -0,0 +1,126 @@
+import fnmatch
+from collections import defaultdict
+
+from qgis.PyQt import QtCore
+import numpy as np
+
+
+class ListModel(QtCore.QAbstractListModel):
+    """List model of display strings, each with a key such as its number.
+
+    One model can be set on several views, so a list shown on more than one
+    tab is only built once. Items are given already sorted.
+    """
+
+    KeyRole = QtCore.Qt.UserRole + 1000
+
+    def __init__(self, items=(), keys=None, parent=None):
+        super(ListModel, self).__init__(parent)
+        self._set_items(items, keys)
+
+    def _set_items(self, items, keys):
+        self._items = list(items)
+        self._keys = self._items if keys is None else list(keys)
+        self._rows = np.arange(len(self._items))
+
+    def setItems(self, items, keys=None):
+        """Replace the items shown.
+
+        Args:
+            items (list): display strings, in the order to show them.
+            keys (list): value of each item returned for KeyRole, e.g. the
+                AEP as a float. Defaults to the display strings.
+        """
+        self.beginResetModel()
+        self._set_items(items, keys)
+        self.endResetModel()
+
+    def items(self):
+        return self._items
+
+    def keys(self):
+        return self._keys
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._rows)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < self.rowCount():
+            return QtCore.QVariant()
+        if role == QtCore.Qt.DisplayRole:
+            return self._items[self._rows[index.row()]]
+        elif role == ListModel.KeyRole:
+            return self._keys[self._rows[index.row()]]
+        return QtCore.QVariant()
+
+
+class StormListModel(ListModel):
+    """List model of storm names that can be filtered as the user types.
+
+    Filtering only changes which rows of the model are shown, so no list items
+    are rebuilt. Queries are matched case insensitively as substrings. The
+    storms matching a query are found from a trigram index of the lowercase
+    names, or from the matches of the previous query if the new query extends
+    it, and only those candidates are checked. Queries containing the
+    wildcards * ? or [ are matched with fnmatch instead.
+    """
+
+    def _set_items(self, items, keys):
+        super(StormListModel, self)._set_items(items, keys)
+        self._lower = [storm.lower() for storm in self._items]
+        trigrams = defaultdict(list)
+        for i, storm in enumerate(self._lower):
+            for trigram in {storm[j : j + 3] for j in range(len(storm) - 2)}:
+                trigrams[trigram].append(i)
+        self._trigrams = {
+            trigram: np.array(rows, dtype=np.int64)
+            for trigram, rows in trigrams.items()
+        }
+        self._query = ""
+
+    def setStorms(self, storms):
+        self.setItems(storms)
+
+    def storms(self):
+        return self._items
+
+    def _candidates(self, query):
+        """Rows that may contain query, to be checked against the names."""
+        candidates = np.arange(len(self._items))
+        if self._query and self._query in query:
+            # the new query extends the last one, so can only narrow its matches
+            candidates = self._rows
+        for trigram in {query[j : j + 3] for j in range(len(query) - 2)}:
+            rows = self._trigrams.get(trigram)
+            if rows is None:
+                return np.array([], dtype=np.int64)
+            if len(rows) < len(candidates):
+                candidates = np.intersect1d(candidates, rows, assume_unique=True)
+        return candidates
+
+    def setFilter(self, text):
+        """Show only the storms matching text, or all storms if it is empty."""
+        query = text.lower()
+        if not query:
+            rows = np.arange(len(self._items))
+        elif any(wildcard in query for wildcard in "*?["):
+            pattern = "*" + query + "*"
+            rows = np.array(
+                [
+                    i
+                    for i, storm in enumerate(self._lower)
+                    if fnmatch.fnmatchcase(storm, pattern)
+                ],
+                dtype=np.int64,
+            )
+        else:
+            rows = np.array(
+                [i for i in self._candidates(query) if query in self._lower[i]],
+                dtype=np.int64,
+            )
+        self.beginResetModel()
+        self._query = query
+        self._rows = rows
+        self.endResetModel()
@@ -0,0 +1,115 @@
+# coding=utf-8
+"""Plot test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'danielcopelin@gmail.com'
+__date__ = '2020-09-04'
+__copyright__ = 'Copyright 2020, Dan Copelin'
+
+import os
+import unittest
+
+import numpy as np
+from qgis.PyQt.QtWidgets import QWidget
+
+from wbnm_plot import (
+    PlotController, box_plot, decimate, ensembles, single_hydrograph)
+from wbnm_results_parser import get_results, summarise_peaks
+
+from utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+META_FILE = os.path.join(os.path.dirname(__file__), 'test_Meta.out')
+
+
+class WBNMPlotTest(unittest.TestCase):
+    """Test hydrographs are decimated for plotting."""
+
+    def setUp(self):
+        """Runs before each test."""
+        rng = np.random.default_rng(0)
+        self.time = np.arange(100000) * 0.5
+        self.flow = rng.random(100000) + np.sin(self.time / 5000) * 10
+        self.flow[61234] = 50.0
+
+    def test_decimate(self):
+        """Test decimation keeps the ends and extremes of each bin."""
+        time, flow = decimate(self.time, self.flow, 500)
+        self.assertLessEqual(len(time), 4 * 500)
+        self.assertTrue(np.all(np.diff(time) > 0))
+        self.assertEqual(time[0], self.time[0])
+        self.assertEqual(time[-1], self.time[-1])
+        self.assertEqual(flow.max(), 50.0)
+        self.assertEqual(time[flow.argmax()], self.time[61234])
+        self.assertEqual(flow.min(), self.flow.min())
+        # every kept point is one of the original points
+        np.testing.assert_array_equal(
+            flow, self.flow[np.searchsorted(self.time, time)])
+
+    def test_decimate_short(self):
+        """Test lines with few points are left as they are."""
+        time, flow = decimate(self.time[:1000], self.flow[:1000], 500)
+        np.testing.assert_array_equal(time, self.time[:1000])
+        np.testing.assert_array_equal(flow, self.flow[:1000])
+
+    def test_decimate_xlim(self):
+        """Test decimation to a zoomed view keeps the detail in view."""
+        time, flow = decimate(self.time, self.flow, 500, xlim=(30000, 30400))
+        # the view has 801 points, plus one either side of it
+        np.testing.assert_array_equal(time, self.time[59999:60802])
+        time, flow = decimate(self.time, self.flow, 100, xlim=(30000, 31000))
+        self.assertLess(time[0], 30000)
+        self.assertGreater(time[-1], 31000)
+        self.assertEqual(flow.max(), 50.0)
+
+
+class PlotControllerTest(unittest.TestCase):
+    """Test plots are updated with new data."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.widget = QWidget()
+        self.plot = PlotController(self.widget)
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.plot = None
+        self.widget = None
+
+    def test_new_data_after_zoom(self):
+        """Test new data is shown in full after zooming in on the last."""
+        time = np.arange(100.0)
+        single_hydrograph(self.plot, time, np.sin(time))
+        self.plot.ax.set_xlim(10, 20)
+        time = np.arange(500.0, 1500.0)
+        single_hydrograph(self.plot, time, np.cos(time))
+        xmin, xmax = self.plot.ax.get_xlim()
+        self.assertLessEqual(xmin, 500.0)
+        self.assertGreaterEqual(xmax, 1499.0)
+
+    def test_box_plot_no_storms(self):
+        """Test a box plot of an AEP not run for a subarea is left empty."""
+        peaks, _ = get_results(META_FILE, cache=False)
+        summary = summarise_peaks(peaks)
+        subarea, aep, _ = summary.index[0]
+        self.assertTrue(box_plot(self.plot, subarea, aep, summary))
+        self.assertFalse(box_plot(self.plot, subarea, 99.0, summary))
+        self.assertEqual(self.plot.ax.get_title(), '')
+
+    def test_ensembles_no_storms(self):
+        """Test an ensemble of no storms leaves the plot empty."""
+        time = np.arange(100.0)
+        ensembles(self.plot, [time], [np.sin(time)], ['storm'])
+        ensembles(self.plot, [], [], [])
+        self.assertEqual(len(self.plot.collection.get_segments()), 0)
+        self.assertIsNone(self.plot.ax.get_legend())
+
+
+if __name__ == "__main__":
+    unittest.main()
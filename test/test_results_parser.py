@@ -0,0 +1,266 @@
+# coding=utf-8
+"""Results parser test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'danielcopelin@gmail.com'
+__date__ = '2020-09-04'
+__copyright__ = 'Copyright 2020, Dan Copelin'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from wbnm_results_parser import (
+    CHUNK_SIZE, critical_durations, export_results, get_hydrographs, get_peaks,
+    get_results, index_peaks, index_results, summarise_peaks)
+
+try:
+    import h5py
+    import pyarrow.parquet as pq
+except ImportError:
+    h5py = pq = None
+
+META_FILE = os.path.join(os.path.dirname(__file__), 'test_Meta.out')
+
+
+class WBNMResultsParserTest(unittest.TestCase):
+    """Test _Meta.out results are parsed."""
+
+    def test_get_peaks(self):
+        """Test a row is stored for every storm, subarea and variable."""
+        peaks = get_peaks(META_FILE)
+        self.assertEqual(len(peaks), 12 * 3 * 8)
+        self.assertEqual(
+            list(peaks.subarea.unique()), ['Town(0)A', 'Sub1', 'Town(2)A'])
+        first = peaks.iloc[0]
+        self.assertEqual(first.storm, 'ARR01-1-60-1(Design)')
+        self.assertEqual(first.aep, 1.0)
+        self.assertEqual(first.dur, 60)
+        self.assertEqual(first.variable, 'out_str')
+        self.assertAlmostEqual(first.value, 13.436)
+        self.assertEqual(peaks.storm.dtype, 'category')
+        self.assertEqual(peaks.aep.dtype, np.float64)
+
+    def test_get_peaks_wide(self):
+        """Test the wide layout has a column for each variable."""
+        peaks = get_peaks(META_FILE)
+        wide = get_peaks(META_FILE, wide=True)
+        self.assertEqual(len(wide), 12 * 3)
+        self.assertEqual(
+            list(wide.columns),
+            ['storm', 'id', 'aep', 'dur', 'ens', 'type', 'subarea', 'out_str',
+             'top', 'bottom', 'perv', 'imp', 'dir', 'in', 'out'])
+        np.testing.assert_array_equal(
+            wide.out, peaks.loc[peaks.variable == 'out', 'value'])
+
+    def test_index_peaks(self):
+        """Test indexed lookups match filtering the whole table."""
+        peaks = get_peaks(META_FILE)
+        indexed = index_peaks(peaks)
+        expected = peaks.loc[
+            (peaks.subarea == 'Sub1') & (peaks.variable == 'out') &
+            (peaks.aep == 2.0) & (peaks.dur == 120)]
+        selection = indexed.loc[('Sub1', 'out', 2.0, 120)]
+        self.assertEqual(sorted(selection.storm), sorted(expected.storm))
+        self.assertEqual(sorted(selection.value), sorted(expected.value))
+
+    def test_get_hydrographs(self):
+        """Test every hydrograph block is stored by subarea and storm."""
+        hydrographs = get_hydrographs(META_FILE)
+        self.assertEqual(len(hydrographs), 3 * 12)
+        self.assertEqual(hydrographs.subareas, ['Town(0)A', 'Sub1', 'Town(2)A'])
+        self.assertEqual(len(hydrographs.storms('Sub1')), 12)
+        storm = 'ARR01-1-60-1(Design)'
+        self.assertEqual(hydrographs.hydrograph('Town(0)A', storm).shape, (10, 6))
+        self.assertEqual(
+            list(hydrographs.column('Town(0)A', storm, 'Time')),
+            [0, 5, 10, 15, 20, 25])
+        self.assertAlmostEqual(
+            hydrographs.column('Town(0)A', storm, 'Qout_OS')[0], 2.3087)
+
+    def test_get_hydrographs_float32(self):
+        """Test hydrographs can be stored in single precision."""
+        hydrographs = get_hydrographs(META_FILE, dtype=np.float32)
+        flow = hydrographs.column('Sub1', 'ARR01-1-60-1(Design)', 'Qout_OS')
+        self.assertEqual(flow.dtype, np.float32)
+
+    def test_get_results(self):
+        """Test the single pass parser matches the individual parsers."""
+        peaks, hydrographs = get_results(META_FILE, cache=False)
+        self.assertTrue(peaks.equals(get_peaks(META_FILE)))
+        expected = get_hydrographs(META_FILE)
+        self.assertEqual(list(hydrographs.keys()), list(expected.keys()))
+        for subarea, storm in expected.keys():
+            np.testing.assert_array_equal(
+                hydrographs.hydrograph(subarea, storm),
+                expected.hydrograph(subarea, storm))
+
+    def test_get_results_parallel(self):
+        """Test parsing in worker processes matches the serial parser."""
+        peaks, hydrographs = get_results(
+            META_FILE, cache=False, workers=2, chunk_size=4096)
+        expected_peaks, expected = get_results(META_FILE, cache=False)
+        self.assertTrue(peaks.equals(expected_peaks))
+        self.assertEqual(list(hydrographs.keys()), list(expected.keys()))
+        for subarea, storm in expected.keys():
+            np.testing.assert_array_equal(
+                hydrographs.hydrograph(subarea, storm),
+                expected.hydrograph(subarea, storm))
+
+    def test_index_results(self):
+        """Test lazily loaded hydrographs match the fully parsed ones."""
+        peaks, hydrographs = index_results(META_FILE, cache=False)
+        expected_peaks, expected = get_results(META_FILE, cache=False)
+        self.assertTrue(peaks.equals(expected_peaks))
+        self.assertEqual(list(hydrographs.keys()), list(expected.keys()))
+        for subarea, storm in expected.keys():
+            np.testing.assert_array_equal(
+                hydrographs.hydrograph(subarea, storm),
+                expected.hydrograph(subarea, storm))
+
+    def test_summarise_peaks(self):
+        """Test the ensemble of each subarea, aep and dur is summarised."""
+        peaks = get_peaks(META_FILE)
+        summary = summarise_peaks(peaks)
+        self.assertEqual(len(summary), 12)
+        self.assertEqual(summary.index.names, ['subarea', 'aep', 'dur'])
+        self.assertTrue(summary.index.is_monotonic_increasing)
+        row = summary.loc[('Sub1', 1.0, 60)]
+        values = peaks.loc[
+            (peaks.subarea == 'Sub1') & (peaks.aep == 1.0)
+            & (peaks.dur == 60) & (peaks.variable == 'out'), 'value']
+        self.assertEqual(row['count'], 3)
+        self.assertAlmostEqual(row['mean'], values.mean())
+        self.assertAlmostEqual(row['median'], 72.154)
+        self.assertAlmostEqual(row['q1'], np.percentile(values, 25))
+        self.assertEqual(row['storm'], 'ARR01-1-60-1(Design)')
+        self.assertAlmostEqual(row['storm_value'], 72.154)
+
+    def test_critical_durations(self):
+        """Test the duration with the highest median is critical."""
+        summary = summarise_peaks(get_peaks(META_FILE))
+        critical = critical_durations(summary)
+        self.assertEqual(len(critical), 6)
+        self.assertEqual(critical.loc[('Sub1', 1.0), 'dur'], 60)
+        self.assertEqual(critical.loc[('Sub1', 2.0), 'dur'], 120)
+        self.assertEqual(
+            critical.loc[('Sub1', 2.0), 'storm'], 'ARR03-2-120-3(Design)')
+        _, _, results_summary = get_results(
+            META_FILE, cache=False, summary=True)
+        self.assertTrue(results_summary.equals(summary))
+
+    def test_results_cache(self):
+        """Test cached results are reused until the file changes."""
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        meta_file = os.path.join(temp_dir, 'test_Meta.out')
+        shutil.copy(META_FILE, meta_file)
+
+        for read_results in (get_results, index_results):
+            peaks, hydrographs = read_results(meta_file)
+            cached_peaks, cached = read_results(meta_file)
+            self.assertTrue(cached_peaks.equals(peaks))
+            self.assertEqual(list(cached.keys()), list(hydrographs.keys()))
+            for subarea, storm in hydrographs.keys():
+                np.testing.assert_array_equal(
+                    cached.hydrograph(subarea, storm),
+                    hydrographs.hydrograph(subarea, storm))
+            _, _, cached_summary = read_results(meta_file, summary=True)
+            self.assertTrue(cached_summary.equals(summarise_peaks(peaks)))
+
+        with open(meta_file, 'a') as meta:
+            meta.write('\n')
+        with open(meta_file + '.index.json') as index:
+            signature = index.read()
+        index_results(meta_file)
+        with open(meta_file + '.index.json') as index:
+            self.assertNotEqual(index.read(), signature)
+
+    @unittest.skipIf(pq is None, 'pyarrow and h5py are needed to export')
+    def test_export_results(self):
+        """Test results are exported a part at a time to Parquet and HDF5."""
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        peaks_path = os.path.join(temp_dir, 'peaks')
+        hydrographs_path = os.path.join(temp_dir, 'hydrographs.h5')
+        export_results(
+            META_FILE, peaks_path, hydrographs_path, chunk_size=4096)
+
+        peaks, hydrographs = get_results(META_FILE, cache=False)
+        self.assertEqual(
+            sorted(os.listdir(peaks_path)), ['aep=1', 'aep=2'])
+        exported = pq.read_table(peaks_path).to_pandas()
+        self.assertEqual(len(exported), len(peaks))
+        self.assertAlmostEqual(exported['value'].sum(), peaks['value'].sum())
+
+        with h5py.File(hydrographs_path, 'r') as exported:
+            self.assertEqual(len(exported['locations']), len(hydrographs))
+            for subarea, storm, (start, stop) in zip(
+                    exported['subareas'].asstr(), exported['storms'].asstr(),
+                    exported['locations']):
+                np.testing.assert_array_equal(
+                    exported['data'][:, start:stop],
+                    hydrographs.hydrograph(subarea, storm))
+
+    @unittest.skipIf(pq is None, 'pyarrow and h5py are needed to export')
+    def test_export_results_twice(self):
+        """Test exporting to the same path again replaces the first export."""
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        peaks_path = os.path.join(temp_dir, 'peaks')
+        hydrographs_path = os.path.join(temp_dir, 'hydrographs.h5')
+        export_results(
+            META_FILE, peaks_path, hydrographs_path, chunk_size=2048)
+        export_results(
+            META_FILE, peaks_path, hydrographs_path, chunk_size=10 ** 9)
+
+        peaks, hydrographs = get_results(META_FILE, cache=False)
+        exported = pq.read_table(peaks_path).to_pandas()
+        self.assertEqual(len(exported), len(peaks))
+        with h5py.File(hydrographs_path, 'r') as exported:
+            self.assertEqual(len(exported['locations']), len(hydrographs))
+
+
+    @unittest.skipIf(pq is None, 'pyarrow and h5py are needed to export')
+    def test_export_results_without_hydrographs(self):
+        """Test parts of a file with no hydrographs are exported."""
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        peaks_only = os.path.join(temp_dir, 'peaks_only_Meta.out')
+        with open(META_FILE) as infile, open(peaks_only, 'w') as outfile:
+            in_hydrographs = False
+            for line in infile:
+                in_hydrographs |= line.startswith('#####START_HYDROGRAPHS')
+                if not in_hydrographs:
+                    outfile.write(line)
+                if line.startswith('#####END_HYDROGRAPHS'):
+                    in_hydrographs = False
+
+        # a whole file without hydrographs, and parts of one file small
+        # enough that some have none
+        for meta_file, chunk_size in ((peaks_only, CHUNK_SIZE), (META_FILE, 1)):
+            peaks_path = os.path.join(temp_dir, 'peaks')
+            hydrographs_path = os.path.join(temp_dir, 'hydrographs.h5')
+            export_results(
+                meta_file, peaks_path, hydrographs_path, chunk_size=chunk_size)
+
+            peaks, hydrographs = get_results(meta_file, cache=False)
+            exported = pq.read_table(peaks_path).to_pandas()
+            self.assertEqual(len(exported), len(peaks))
+            with h5py.File(hydrographs_path, 'r') as exported:
+                self.assertEqual(len(exported['locations']), len(hydrographs))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(WBNMResultsParserTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -13,7 +13,14 @@ import unittest
 import logging
 import configparser
 
+import numpy as np
+
+from wbnm_runfile_parser import (
+    SINK, CatchmentGraph, LossRates, RecordedHydrographsBlock, Runfile,
+    TopologyBlock, index_blocks)
+
 LOGGER = logging.getLogger('QGIS')
+RUNFILE = os.path.join(os.path.dirname(__file__), 'testrunfile.wbn')
 
 
 class TestInit(unittest.TestCase):
@@ -60,5 +67,184 @@ class TestInit(unittest.TestCase):
 
             self.assertIn(expectation, dict(metadata), message)
 
+
+class WBNMRunfileTest(unittest.TestCase):
+    """Test WBNM runfiles are parsed."""
+
+    def test_index_blocks(self):
+        """Test the lines of every block are found, including nested ones."""
+        lines = [
+            '#####START_OUTER_BLOCK####|####|\n',
+            'a\n',
+            '#####START_INNER#1\n',
+            '#####START_DETAILS2016\n',
+            'b\n',
+            '#####END_DETAILS\n',
+            '#####END_INNER#1\n',
+            '#####END_OUTER_BLOCK######|####|\n',
+        ]
+        self.assertEqual(index_blocks(lines), {
+            ('OUTER_BLOCK', 'INNER#1', 'DETAILS2016'): (4, 5),
+            ('OUTER_BLOCK', 'INNER#1'): (3, 6),
+            ('OUTER_BLOCK',): (1, 7),
+        })
+
+    def test_runfile_blocks(self):
+        """Test each block is given the lines between its START and END."""
+        runfile = Runfile(RUNFILE)
+        self.assertEqual(len(runfile.preamble.block_contents), 8)
+        self.assertEqual(runfile.status.block_contents[3].strip(), '2017_000')
+        self.assertEqual(len(runfile.topology.topology), 233)
+        self.assertEqual(len(runfile.surfaces.surfaces), 233)
+        self.assertEqual(
+            runfile.sub_blocks['OUTLET_STRUCTURES_BLOCK'][
+                ('OUTLET_STRUCTURE#1', 'OUTLET_DETAILS')], (6, 22))
+        self.assertIn(
+            ('STORM_BLOCK', 'STORM#3', 'DESIGN_RAIN_ARR2016'), runfile.blocks)
+
+    def test_runfile_lazy(self):
+        """Test blocks are only parsed when used, and then only once."""
+        runfile = Runfile(RUNFILE)
+        self.assertEqual(runfile.status.version_number.strip(), '2017_000')
+        # only the lines up to the end of the status block are indexed
+        self.assertNotIn(('TOPOLOGY_BLOCK',), runfile._spans)
+        self.assertIs(runfile.status, runfile.status)
+        self.assertNotIn(TopologyBlock, runfile._parsed_blocks)
+
+        self.assertEqual(runfile.topology.num_subareas, '233')
+        self.assertIsNone(runfile.topology._topology)
+        self.assertIs(runfile.topology.topology, runfile.topology.topology)
+
+    def test_tables(self):
+        """Test topology, surfaces and flowpaths tables match their dicts."""
+        runfile = Runfile(RUNFILE)
+        topology = runfile.topology.table
+        self.assertEqual(len(topology), 233)
+        names = list(topology['name'])
+        for row in topology:
+            downstream = runfile.topology.topology[row['name']].downstream_sub_name
+            if downstream == 'SINK':
+                self.assertEqual(row['downstream'], SINK)
+            else:
+                self.assertEqual(names[row['downstream']], downstream)
+            self.assertEqual(
+                row['cg_e'], float(runfile.topology.topology[row['name']].cg_e))
+
+        surfaces = runfile.surfaces.table
+        self.assertEqual(list(surfaces['name']), names)
+        self.assertAlmostEqual(
+            runfile.surfaces.total_area,
+            sum(float(surface.area) for surface in runfile.surfaces.surfaces.values()))
+        self.assertTrue(0 < runfile.surfaces.impervious_fraction < 1)
+        self.assertEqual(runfile.surfaces.discharge_when_routing_switches.strip(), '-99.9')
+
+        flowpaths = runfile.flowpaths.table
+        self.assertEqual(len(flowpaths), 155)
+        self.assertEqual(flowpaths[0]['name'], 'WollB')
+        self.assertEqual(flowpaths[0]['stream_lag'], 1.0)
+        self.assertTrue(np.isnan(flowpaths[0]['musk_k']))
+
+    def test_graph(self):
+        """Test the catchment graph's order, upstream subareas and totals."""
+        runfile = Runfile(RUNFILE)
+        graph = runfile.topology.graph
+        downstream = graph.downstream
+        position = np.empty(len(graph.order), dtype=int)
+        position[graph.order] = np.arange(len(graph.order))
+        for node, next_node in enumerate(downstream):
+            if next_node != SINK:
+                self.assertLess(position[node], position[next_node])
+
+        node = graph.ids['WollB']
+        self.assertEqual(list(graph.names[graph.inflows(node)]), ['WollA'])
+        self.assertEqual(sorted(graph.names[graph.upstream(node)]), ['WollA', 'WollB'])
+        path = graph.downstream_path(node)
+        self.assertEqual(list(graph.names[path[:3]]), ['WollB', 'WollC', 'WollD'])
+        self.assertEqual(downstream[path[-1]], SINK)
+        self.assertTrue(graph.is_upstream(graph.ids['WollA'], path[-1]))
+        self.assertFalse(graph.is_upstream(path[-1], node))
+
+        # everything drains to the one outlet
+        outlet = path[-1]
+        self.assertEqual(len(graph.upstream(outlet)), 233)
+        areas = graph.accumulate(runfile.surfaces.table['area'])
+        self.assertAlmostEqual(areas[outlet], runfile.surfaces.total_area)
+        self.assertAlmostEqual(
+            areas[node], runfile.surfaces.table['area'][[graph.ids['WollA'], node]].sum())
+
+    def test_graph_loop(self):
+        """Test subareas draining in a loop are an error."""
+        with self.assertRaises(ValueError):
+            CatchmentGraph(['A', 'B', 'C'], [1, 0, SINK])
+
+    def test_topology_unknown_downstream(self):
+        """Test a downstream subarea missing from the topology is an error."""
+        topology = TopologyBlock([
+            '           2   Test\n',
+            'A  1.0  1.0  2.0  2.0 B\n',
+            'B  2.0  2.0  3.0  3.0 Typo\n',
+        ])
+        with self.assertRaisesRegex(ValueError, 'Typo'):
+            topology.table
+
+    def test_outlet_structures(self):
+        """Test outlet structures are parsed with their H-S-Q tables."""
+        runfile = Runfile(RUNFILE)
+        self.assertEqual(runfile.local_structures.structures, {})
+        structures = runfile.outlet_structures.structures
+        self.assertEqual(len(structures), 9)
+        structure = structures[4]
+        self.assertEqual(structure.subarea_name, 'MacRivT')
+        self.assertEqual(structure.structure_type, 'hsq')
+        self.assertEqual(
+            [outlet.downstream_sub_name for outlet in structure.outlets],
+            ['CaldE', 'MacRivU'])
+        self.assertEqual(structure.outlets[0].position, 'TOP')
+        self.assertEqual(structure.hsq.shape, (7, 4))
+        np.testing.assert_array_equal(
+            structure.elevation, [11.0, 11.5, 12.0, 12.5, 13.0, 13.5, 14.0])
+        np.testing.assert_array_equal(structure.discharge[2], [851.0, 851.0])
+        self.assertEqual(structure.initial_water_level, 11.0)
+        for structure in structures.values():
+            self.assertEqual(
+                structure.discharge.shape[1], len(structure.outlets))
+
+    def test_storms(self):
+        """Test storms are parsed with their design rain and losses."""
+        runfile = Runfile(RUNFILE)
+        storms = runfile.storms.storms
+        self.assertEqual(len(storms), 8)
+        storm = storms[4]
+        np.testing.assert_array_equal(storm.time_steps, [5.0, 5.0])
+        self.assertEqual(storm.rain_type, 'DESIGN_RAIN_ARR2016')
+        self.assertEqual(storm.rain.aep, 2.0)
+        self.assertEqual(storm.rain.duration, -1)
+        self.assertEqual(storm.rain.subarea_name, 'MacRivE')
+        self.assertEqual(len(storm.rain.ifd_gauges), 9)
+        self.assertEqual(
+            storm.rain.sources['PAT_DATA_IN_REGION_FILE'],
+            ['SSmainland_Increments.csv'])
+        self.assertEqual(storm.loss_rates.loss_type, 'ARRLOSSES')
+        self.assertEqual(storm.recorded_hydrographs.hydrographs, {})
+        self.assertIsNone(storms[1].rain.subarea_name)
+
+    def test_storm_values(self):
+        """Test loss values and recorded hydrographs are kept as arrays, or as lines."""
+        losses = LossRates(['#####IL/CL\n', '   10.0   2.5\n', '    0.0   0.0\n'])
+        np.testing.assert_array_equal(losses.values, [[10.0, 2.5], [0.0, 0.0]])
+        losses = LossRates(['#####IL/CL\n', '   10.0   2.5\n', 'MacRivE\n'])
+        self.assertEqual(losses.values, ['10.0   2.5', 'MacRivE'])
+
+        recorded = RecordedHydrographsBlock([
+            '           2\n',
+            'MacRivE\n', '    0.0   0.0\n', '   60.0  12.5\n',
+            'MacRivO\n', '   25   60.0\n', '    0.0   3.1   9.2\n',
+        ])
+        np.testing.assert_array_equal(
+            recorded.hydrographs['MacRivE'].values, [[0.0, 0.0], [60.0, 12.5]])
+        self.assertEqual(
+            recorded.hydrographs['MacRivO'].values, ['25   60.0', '0.0   3.1   9.2'])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,110 +1,379 @@
 from qgis.PyQt.QtWidgets import QVBoxLayout
 
-import matplotlib.pyplot as plt
+import matplotlib
+import numpy as np
 from matplotlib.backends.backend_qt5agg import (
     FigureCanvasQTAgg as FigureCanvas,
     NavigationToolbar2QT as NavigationToolbar,
 )
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
 
 
-def update_plot(fig, widget, child=2):
-    """[summary]
+def decimate(x, y, bins, xlim=None):
+    """Reduce a line to the points that decide how it looks at a given width.
+
+    The x range is split into equal bins, e.g. one per pixel, and only the
+    first, last, lowest and highest point of each bin are kept, in order. The
+    peak and trough of every bin are kept exactly, so the decimated line
+    looks the same as the full one and has the same peak.
 
     Args:
-        fig ([type]): [description]
-        widget ([type]): [description]
-        child (int, optional): [description]. Defaults to 2.
+        x (np.ndarray): x values, increasing.
+        y (np.ndarray): y values.
+        bins (int): number of bins to split the x range into.
+        xlim (tuple, optional): range of x shown. Points outside it are
+            dropped, except the nearest on each side so the line reaches the
+            edges. Defaults to None, for all points.
+
+    Returns:
+        tuple: the decimated x and y values.
     """
-    if len(widget.children()) > 0:
-        canvas = widget.children()[child]
-        old_ax = canvas.figure.get_axes()[0]
-        new_ax = fig.get_axes()[0]
-
-        # update lines
-        for old_line, new_line in zip(old_ax.get_lines(), new_ax.get_lines()):
-            old_line.set_xdata(new_line.get_xdata())
-            old_line.set_ydata(new_line.get_ydata())
-
-        # update legend if there is one
-        old_legend, new_legend = old_ax.legend(), new_ax.legend()
-        if old_legend:
-            for old_text, new_text in zip(old_legend.texts, new_legend.texts):
-                old_text._text = new_text._text
-
-        old_ax.relim()
-        old_ax.autoscale_view()
-        canvas.draw_idle()
-    else:
-        canvas = FigureCanvas(fig)
-        toolbar = NavigationToolbar(canvas, widget)
-        layout = QVBoxLayout(widget)
-        layout.addWidget(toolbar)
-        layout.addWidget(canvas)
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if xlim is not None:
+        start = max(np.searchsorted(x, xlim[0], side="left") - 1, 0)
+        stop = min(np.searchsorted(x, xlim[1], side="right") + 1, len(x))
+        x = x[start:stop]
+        y = y[start:stop]
+    if len(x) <= 4 * bins:
+        return x, y
 
+    # first point of each non-empty bin
+    edges = np.linspace(x[0], x[-1], bins + 1)[1:-1]
+    starts = np.unique(np.append(0, np.searchsorted(x, edges, side="right")))
+    counts = np.diff(np.append(starts, len(x)))
+    bin_of = np.repeat(np.arange(len(starts)), counts)
 
-def single_hydrograph(time, flow):
-    """[summary]
+    keep = [starts, starts + counts - 1]
+    for extreme in (np.minimum, np.maximum):
+        values = extreme.reduceat(y, starts)
+        # first point of each bin with the bin's extreme value
+        candidates = np.flatnonzero(y == values[bin_of])
+        _, first = np.unique(bin_of[candidates], return_index=True)
+        keep.append(candidates[first])
+    keep = np.unique(np.concatenate(keep))
+    return x[keep], y[keep]
 
-    Args:
-        time ([type]): [description]
-        flow ([type]): [description]
 
-    Returns:
-        [type]: [description]
-    """
-    fig, ax = plt.subplots()
-    ax.plot(time, flow)
-    fig.tight_layout()
+class _NavigationToolbar(NavigationToolbar):
+    """Toolbar that saves the animated artists of a plot with the rest of it."""
 
-    ax.set_xlabel("Time, minutes")
-    ax.set_ylabel("Flow, cumecs")
+    def __init__(self, canvas, parent, plot):
+        super(_NavigationToolbar, self).__init__(canvas, parent)
+        self._plot = plot
 
-    return fig
+    def save_figure(self, *args):
+        # animated artists are left out of savefig
+        artists = self._plot.data_artists()
+        for artist in artists:
+            artist.set_animated(False)
+        try:
+            return super(_NavigationToolbar, self).save_figure(*args)
+        finally:
+            for artist in artists:
+                artist.set_animated(True)
 
 
-def box_plot(subarea, aep, peaks):
-    """[summary]
+class PlotController(object):
+    """Canvas, toolbar, axes and data artists kept for the life of a plot widget.
 
-    Args:
-        subarea ([type]): [description]
-        aep ([type]): [description]
-        peaks ([type]): [description]
+    New data is shown by changing the data of the existing artists rather
+    than building a new figure. Data is drawn either as separate lines, or as
+    a single LineCollection of any number of lines, e.g. for an ensemble. The
+    data artists are animated, so each full draw of the canvas caches
+    everything else (axes, ticks, labels, legend) as the background. If new
+    data keeps the axes limits and legend as they were, only the data artists
+    are drawn over the background and blitted to the canvas; otherwise the
+    canvas is drawn in full.
 
-    Returns:
-        [type]: [description]
+    Lines are decimated to the points that matter at the width of the axes in
+    pixels, and decimated again from the full data whenever the x limits
+    change, e.g. by zooming or panning with the toolbar, or the canvas is
+    resized. Peaks are always kept exactly.
+
+    The figure is made without pyplot, so it isn't held by pyplot's figure
+    manager and is freed with the widget. Lines no longer needed are hidden
+    and kept for reuse, up to MAX_SPARE_LINES of them, so memory doesn't grow
+    however many plots are made.
+
+    Args:
+        widget (QWidget): widget to hold the toolbar and canvas.
+        xlabel (str, optional): Defaults to "Time, minutes".
+        ylabel (str, optional): Defaults to "Flow, cumecs".
     """
-    selection = peaks.loc[
-        (peaks.aep == aep) & (peaks.subarea == subarea) & (peaks.variable == "out")
-    ]
-    durations = selection.dur.unique()
-    data = [
-        list(selection.loc[selection.dur == duration, "value"])
-        for duration in durations
-    ]
 
-    fig, ax = plt.subplots()
-    ax.boxplot(data, labels=durations)
+    # number of hidden lines kept for reuse
+    MAX_SPARE_LINES = 32
+    # legends with more entries than this aren't shown
+    MAX_LEGEND_ENTRIES = 20
+
+    def __init__(self, widget, xlabel="Time, minutes", ylabel="Flow, cumecs"):
+        self.figure = Figure(tight_layout=True)
+        self.canvas = FigureCanvas(self.figure)
+        self.toolbar = _NavigationToolbar(self.canvas, widget, self)
+        layout = QVBoxLayout(widget)
+        layout.addWidget(self.toolbar)
+        layout.addWidget(self.canvas)
+
+        self.ax = self.figure.add_subplot()
+        self.xlabel = xlabel
+        self.ylabel = ylabel
+        self._background = None
+        self.clear()
+        self.canvas.mpl_connect("draw_event", self._on_draw)
+        self.canvas.mpl_connect("resize_event", self._on_resize)
+
+    def clear(self):
+        """Remove everything from the axes except the axis labels."""
+        self.ax.cla()
+        self.ax.set_xlabel(self.xlabel)
+        self.ax.set_ylabel(self.ylabel)
+        # cla also disconnects the axes callbacks
+        self.ax.callbacks.connect("xlim_changed", self._on_xlim_changed)
+        self.lines = []
+        self._spare_lines = []
+        self.collection = None
+        self._collection_limits = None
+        self._line_data = []
+        self._segment_data = []
+        self._autoscaling = False
+        self._labels = None
+
+    def _decimate(self, x, y, xlim=None):
+        # one bin per pixel across the axes
+        return decimate(x, y, max(int(self.ax.bbox.width), 100), xlim)
+
+    def _decimate_data(self, xlim=None):
+        """Decimate the full data of every line to the view."""
+        for line, (x, y) in zip(self.lines, self._line_data):
+            line.set_data(*self._decimate(x, y, xlim))
+        if self.collection is not None:
+            self.collection.set_segments(
+                [
+                    np.column_stack(self._decimate(x, y, xlim))
+                    for x, y in self._segment_data
+                ]
+            )
+
+    def _on_xlim_changed(self, ax):
+        # limits set by autoscaling after new data take in all of it
+        if not self._autoscaling:
+            self._decimate_data(ax.get_xlim())
+
+    def _on_resize(self, event):
+        self._decimate_data(self.ax.get_xlim())
+
+    def data_artists(self):
+        """The animated artists showing the data."""
+        if self.collection is None:
+            return list(self.lines)
+        return self.lines + [self.collection]
+
+    def _draw_data(self):
+        for artist in self.data_artists():
+            self.ax.draw_artist(artist)
+
+    def _on_draw(self, event):
+        # savefig draws the figure on another canvas
+        if event.canvas is not self.canvas:
+            return
+        self._background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self._draw_data()
 
-    ax.set_xlabel("Storm duration, minutes")
-    ax.set_ylabel("Flow, cumecs")
+    def _blit(self):
+        """Draw only the data, over the background of the last full draw."""
+        self.canvas.restore_region(self._background)
+        self._draw_data()
+        self.canvas.blit(self.figure.bbox)
 
-    return fig
+    def draw(self):
+        """Draw the canvas in full, forgetting any zoom of the previous data."""
+        self._background = None
+        self.toolbar.update()
+        self.canvas.draw_idle()
 
+    def _colors(self, n):
+        """Colours of the property cycle for n lines."""
+        colors = matplotlib.rcParams["axes.prop_cycle"].by_key()["color"]
+        return [colors[i % len(colors)] for i in range(n)]
 
-def ensembles(times, flows, storms):
-    """[summary]
+    def set_lines(self, xs, ys, labels=None):
+        """Show a line for each pair of x and y arrays, reusing existing lines.
+
+        Args:
+            xs (list): x values of each line.
+            ys (list): y values of each line.
+            labels (list, optional): legend label of each line. Defaults to
+                None, for no legend.
+        """
+        redraw = len(self.lines) != len(xs)
+        for line in self.lines[len(xs) :]:
+            if len(self._spare_lines) < self.MAX_SPARE_LINES:
+                line.set_visible(False)
+                line.set_data([], [])
+                self._spare_lines.append(line)
+            else:
+                line.remove()
+        del self.lines[len(xs) :]
+        while len(self.lines) < len(xs):
+            if self._spare_lines:
+                line = self._spare_lines.pop()
+                line.set_visible(True)
+            else:
+                (line,) = self.ax.plot([], [], animated=True)
+            self.lines.append(line)
+        self._line_data = list(zip(xs, ys))
+        self._decimate_data()
+
+        self._update(redraw, labels, lambda: self.lines)
+
+    def set_segments(self, xs, ys, labels=None):
+        """Show all pairs of x and y arrays as the lines of one LineCollection.
+
+        Args:
+            xs (list): x values of each line.
+            ys (list): y values of each line.
+            labels (list, optional): legend label of each line. Defaults to
+                None, for no legend.
+        """
+        self._segment_data = list(zip(xs, ys))
+        segments = [np.column_stack(self._decimate(x, y)) for x, y in zip(xs, ys)]
+        colors = self._colors(len(segments))
+        if self.collection is None:
+            self.collection = LineCollection(segments, colors=colors, animated=True)
+            self.ax.add_collection(self.collection, autolim=False)
+        else:
+            self.collection.set_segments(segments)
+            self.collection.set_color(colors)
+
+        points = [segment for segment in segments if len(segment)]
+        if points:
+            points = np.concatenate(points)
+            self._collection_limits = np.array(
+                [np.nanmin(points, axis=0), np.nanmax(points, axis=0)]
+            )
+        else:
+            self._collection_limits = None
+
+        self._update(
+            False,
+            labels,
+            lambda: [Line2D([], [], color=color) for color in colors],
+        )
+
+    def _update(self, redraw, labels, handles):
+        """Update the legend and axes limits for new data, and show it.
+
+        Args:
+            redraw (bool): whether the canvas must be drawn in full.
+            labels (list): legend labels, or None for no legend.
+            handles (callable): gives the legend handles of the labels.
+        """
+        if labels is not None:
+            labels = [str(label) for label in labels]
+            if not labels or len(labels) > self.MAX_LEGEND_ENTRIES:
+                labels = None
+        if labels != self._labels:
+            self._labels = labels
+            legend = self.ax.get_legend()
+            if legend is not None:
+                legend.remove()
+            if labels is not None:
+                legend = self.ax.legend(handles(), labels)
+                # legend lines copy the animated flag of the lines
+                for line in legend.get_lines():
+                    line.set_animated(False)
+            redraw = True
+
+        self._autoscaling = True
+        try:
+            # reading viewLim can apply a pending autoscale of new lines
+            limits = self.ax.viewLim.get_points().copy()
+            # zooming or panning with the toolbar turns autoscaling off
+            self.ax.set_autoscale_on(True)
+            self.ax.relim(visible_only=True)
+            if self._collection_limits is not None:
+                self.ax.update_datalim(self._collection_limits)
+            self.ax.autoscale_view()
+        finally:
+            self._autoscaling = False
+        redraw = redraw or not np.array_equal(limits, self.ax.viewLim.get_points())
+
+        if redraw or self._background is None:
+            self.draw()
+        else:
+            self._blit()
+
+
+def single_hydrograph(plot, time, flow):
+    """Plot a single hydrograph.
 
     Args:
-        time ([type]): [description]
-        flows ([type]): [description]
+        plot (PlotController): plot to draw on.
+        time (np.ndarray): times, minutes.
+        flow (np.ndarray): flows, cumecs.
     """
-    fig, ax = plt.subplots()
-    for time, flow, storm in zip(times, flows, storms):
-        ax.plot(time, flow, label=storm)
-    fig.tight_layout()
+    plot.set_lines([time], [flow])
+
 
-    ax.set_xlabel("Time, minutes")
-    ax.set_ylabel("Flow, cumecs")
-    ax.legend()
+def box_plot(plot, subarea, aep, summary):
+    """Plot the spread of peak outflows for each storm duration.
 
-    return fig
+    The boxes are drawn from the precomputed quartiles of the peaks summary,
+    with whiskers to the lowest and highest peak, and the critical duration
+    and its representative storm are given in the title. If no storms were
+    run for the subarea and AEP, the plot is left empty.
+
+    Args:
+        plot (PlotController): plot to draw on.
+        subarea (str): subarea name.
+        aep (float): annual exceedance probability, %.
+        summary (pd.DataFrame): peaks summary from summarise_peaks.
+
+    Returns:
+        bool: whether any storms were run for the subarea and AEP.
+    """
+    if (subarea, aep) not in summary.index:
+        plot.clear()
+        plot.draw()
+        return False
+    selection = summary.loc[(subarea, aep)]
+    stats = [
+        {
+            "label": str(dur),
+            "q1": row.q1,
+            "med": row.median,
+            "q3": row.q3,
+            "whislo": row.min,
+            "whishi": row.max,
+            "mean": row.mean,
+        }
+        for dur, row in zip(selection.index, selection.itertuples())
+    ]
+    critical = selection["median"].idxmax()
+
+    # the number of box plot artists changes with the durations, so they are
+    # drawn afresh rather than reused
+    plot.clear()
+    plot.ax.bxp(stats, showfliers=False)
+    plot.ax.set_title(
+        "Critical duration {} minutes, {}".format(
+            critical, selection.loc[critical, "storm"]
+        )
+    )
+    plot.draw()
+    return True
+
+
+def ensembles(plot, times, flows, storms):
+    """Plot the hydrographs of an ensemble of storms as one LineCollection.
+
+    Args:
+        plot (PlotController): plot to draw on.
+        times (list): times of each storm, minutes.
+        flows (list): flows of each storm, cumecs.
+        storms (list): storm names, for the legend.
+    """
+    plot.set_segments(times, flows, storms)
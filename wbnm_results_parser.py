@@ -1,173 +1,1192 @@
 # %%
+from array import array
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import hashlib
+import json
+import mmap
+import os
+import zipfile
+import numpy as np
 import pandas as pd
 import re
 from dataclasses import dataclass
 
+STORM_COLUMNS = ["storm", "id", "aep", "dur", "ens", "type"]
+PEAK_RESULTS_TYPES = [
+    "subarea",
+    "out_str",
+    "top",
+    "bottom",
+    "perv",
+    "imp",
+    "dir",
+    "in",
+    "out",
+]
+PEAK_VARIABLES = PEAK_RESULTS_TYPES[1:]
+PEAK_INDEX_LEVELS = ["subarea", "variable", "aep", "dur"]
+SUMMARY_INDEX_LEVELS = ["subarea", "aep", "dur"]
+HYDROGRAPH_COLUMNS = ["subarea", "storm", "id", "aep", "dur", "ens", "type"]
+RESULTS_COLUMNS = [
+    "Time",
+    "Rain",
+    "Rainperv",
+    "Qtop",
+    "Qbot",
+    "Qper",
+    "Qimp",
+    "Qinto_OS",
+    "Qout_OS",
+    "Stage",
+]
 
-def get_peaks(meta_file):
+# sidecar cache of parsed results, see _read_cache and _write_cache
+CACHE_VERSION = 3
+HASH_SAMPLE_SIZE = 1024 * 1024
 
-    storm_columns = ["storm", "id", "aep", "dur", "ens", "type", "variable", "value"]
-    peak_results_types = [
-        "subarea",
-        "out_str",
-        "top",
-        "bottom",
-        "perv",
-        "imp",
-        "dir",
-        "in",
-        "out",
-    ]
-    peak_start_pattern = re.compile(
-        r"""
-        ^.+START_PEAK_SUMMARY.+:: # start of line
-        (?=(.+-.+-.+-.+))               # storm
-        (.+)-                           # id
-        (.+)-                           # aep
-        (.+)-                           # dur
-        (.+)                            # ens
-        \((.+)\)                        #type
-        """,
-        re.X,
-    )
-    peak_results_pattern = re.compile(
-        r"""
-        (\S+)\s+        # subarea
-        (\d+\.?\d*)\s+  # out_str
-        (\d+\.?\d*)\s+  # top
-        (\d+\.?\d*)\s+  # bottom
-        (\d+\.?\d*)\s+  # perb
-        (\d+\.?\d*)\s+  # imp
-        (\d+\.?\d*)\s+  # dir
-        (\d+\.?\d*)\s+  # in
-        (\d+\.?\d*)     # out
-        """,
-        re.X,
-    )
-    peak_end_pattern = re.compile(r"^.+END_PEAK_SUMMARY")
+# default size of the byte ranges handed to each worker when parsing in parallel
+CHUNK_SIZE = 64 * 1024 * 1024
+
+# number of time steps in each chunk of the HDF5 hydrograph data
+HDF5_CHUNK_STEPS = 65536
+
+# marker prefixes used to classify each line of a _Meta.out file
+BLOCK_START = b"#####START_"
+PEAK_START = b"#####START_PEAK_SUMMARY"
+HYDROGRAPH_START = b"#####START_HYDROGRAPHS_"
+BLOCK_END = b"#####END_"
+
+# block headers are rare, so their fields are still split out with a regex
+PEAK_START_PATTERN = re.compile(
+    r"""
+    ^.+START_PEAK_SUMMARY.+:: # start of line
+    (?=(.+-.+-.+-.+))               # storm
+    (.+)-                           # id
+    (.+)-                           # aep
+    (.+)-                           # dur
+    (.+)                            # ens
+    \((.+)\)                        #type
+    """,
+    re.X,
+)
+HYDROGRAPH_START_PATTERN = re.compile(
+    r"""
+    .+START_HYDROGRAPHS_    # start of line
+    (\S+)\s*::              # sub area
+    (?=(.+-.+-.+-.+))       # storm
+    (.+)-                   # id
+    (.+)-                   # aep
+    (.+)-                   # dur
+    (.+)                    # ens
+    \((.+)\)                # type
+    """,
+    re.X,
+)
+
+
+class ParseCanceled(Exception):
+    """Raised when parsing is canceled through its feedback object."""
+
+
+def _report_progress(feedback, percent):
+    """Pass the percentage parsed to feedback, stopping if it was canceled.
+
+    Args:
+        feedback (QgsFeedback): feedback object, e.g. a QgsTask, or None.
+        percent (float): percentage of the file parsed so far.
+    """
+    if feedback:
+        if feedback.isCanceled():
+            raise ParseCanceled()
+        feedback.setProgress(percent)
+
+
+def _parse_header(pattern, line):
+    """Split a block header line into its fields, or None if it doesn't match."""
+    match = pattern.match(line.decode("latin-1").rstrip("\r\n"))
+    if match:
+        return match.groups()
+    return None
+
+
+def _decode_hydrograph(chunk, dtype=np.float64):
+    """Decode the data rows of a hydrograph block in a single vectorised call.
+
+    Args:
+        chunk (bytes): whitespace separated data rows of the block.
+        dtype (optional): floating point type of the results.
+            Defaults to np.float64.
+
+    Returns:
+        np.ndarray: (time step x results column) values.
+    """
+    values = np.fromstring(chunk, dtype=dtype, sep=" ")
+    return values.reshape(-1, len(RESULTS_COLUMNS))
+
+
+class _PeakResults:
+    """Peak summary results collected into flat arrays while parsing.
+
+    Each peak summary row is stored as the index of its storm, its subarea and
+    its PEAK_VARIABLES values, rather than as a dict per variable.
+    """
+
+    def __init__(self):
+        self.storms = []
+        self.storm_rows = array("q")
+        self.subareas = []
+        self.values = array("d")
+
+    def add_storm(self, storm_fields):
+        """Start the rows of a new peak summary block."""
+        self.storms.append(storm_fields)
+
+    def parse_rows(self, lines):
+        """Add each row of the current peak summary block.
+
+        Args:
+            lines (iterable): lines of the peak summary block.
+        """
+        storm = len(self.storms) - 1
+        for line in lines:
+            fields = line.split()
+            if len(fields) >= len(PEAK_RESULTS_TYPES) and fields[1][:1].isdigit():
+                self.storm_rows.append(storm)
+                self.subareas.append(fields[0].decode("latin-1"))
+                self.values.extend(map(float, fields[1 : len(PEAK_RESULTS_TYPES)]))
+
+    def extend(self, other):
+        """Add all of the rows of another _PeakResults."""
+        offset = len(self.storms)
+        self.storms.extend(other.storms)
+        self.storm_rows.extend(row + offset for row in other.storm_rows)
+        self.subareas.extend(other.subareas)
+        self.values.extend(other.values)
+
+
+class HydrographStore:
+    """Hydrographs for every subarea and storm in a _Meta.out file.
+
+    The hydrographs are held in a single (results column x time step) array,
+    so each column of a hydrograph is a contiguous slice and is returned as a
+    view rather than a copy. An index maps (subarea, storm) to the slice of
+    time steps belonging to that hydrograph.
+
+    Args:
+        dtype (optional): floating point type of the stored results.
+            Defaults to np.float64.
+    """
+
+    def __init__(self, dtype=np.float64):
+        self.dtype = np.dtype(dtype)
+        self._index = {}
+        self._subareas = defaultdict(list)
+        self._blocks = []
+        self._length = 0
+        self._data = np.empty((len(RESULTS_COLUMNS), 0), dtype=self.dtype)
+
+    def append(self, subarea, storm, values):
+        """Add the hydrograph for a subarea and storm.
+
+        Args:
+            subarea (str): subarea name.
+            storm (str): storm name.
+            values (array-like): (time step x results column) values.
+        """
+        values = np.asarray(values, dtype=self.dtype).reshape(-1, len(RESULTS_COLUMNS))
+        if (subarea, storm) not in self._index:
+            self._subareas[subarea].append(storm)
+        self._index[(subarea, storm)] = (self._length, self._length + len(values))
+        self._blocks.append(values.T)
+        self._length += len(values)
+
+    def finalise(self):
+        """Join the appended hydrographs into the columnar array."""
+        if self._blocks:
+            self._data = np.concatenate([self._data] + self._blocks, axis=1)
+            self._blocks = []
+
+    def hydrograph(self, subarea, storm):
+        """(results column x time step) view of a single hydrograph."""
+        self.finalise()
+        start, stop = self._index[(subarea, storm)]
+        return self._data[:, start:stop]
+
+    def column(self, subarea, storm, column):
+        """View of a single results column, e.g. "Qout_OS", of a hydrograph."""
+        return self.hydrograph(subarea, storm)[RESULTS_COLUMNS.index(column)]
+
+    @property
+    def subareas(self):
+        return list(self._subareas)
+
+    def storms(self, subarea):
+        return list(self._subareas[subarea])
+
+    def keys(self):
+        return self._index.keys()
+
+    def extend(self, other):
+        """Add all of the hydrographs of another HydrographStore."""
+        other.finalise()
+        for (subarea, storm), (start, stop) in other._index.items():
+            if (subarea, storm) not in self._index:
+                self._subareas[subarea].append(storm)
+            self._index[(subarea, storm)] = (self._length + start, self._length + stop)
+        self._blocks.append(other._data.astype(self.dtype, copy=False))
+        self._length += other._length
+
+    def to_arrays(self):
+        """Arrays holding the index and values of the store, for np.savez."""
+        self.finalise()
+        keys = list(self._index)
+        return {
+            "subareas": np.array([subarea for subarea, _ in keys], dtype=str),
+            "storms": np.array([storm for _, storm in keys], dtype=str),
+            "locations": np.array(list(self._index.values()), dtype=np.int64).reshape(
+                -1, 2
+            ),
+            "data": self._data,
+        }
+
+    def load_arrays(self, arrays):
+        """Restore the store from arrays returned by to_arrays."""
+        for subarea, storm, location in zip(
+            arrays["subareas"], arrays["storms"], arrays["locations"]
+        ):
+            subarea, storm = str(subarea), str(storm)
+            if (subarea, storm) not in self._index:
+                self._subareas[subarea].append(storm)
+            self._index[(subarea, storm)] = tuple(int(i) for i in location)
+        self._data = arrays["data"].astype(self.dtype, copy=False)
+        self._length = self._data.shape[1]
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+
+class LazyHydrographStore(HydrographStore):
+    """Hydrographs that are only read from the _Meta.out file when requested.
+
+    Rather than the hydrograph values, the index holds the byte offset and
+    length of the data rows of each hydrograph block. A block is decoded the
+    first time it is requested and kept for later requests, so memory use
+    scales with the hydrographs that are actually viewed.
+
+    Args:
+        meta_file (str): path to the WBNM _Meta.out file.
+        dtype (optional): floating point type of the decoded results.
+            Defaults to np.float64.
+    """
+
+    def __init__(self, meta_file, dtype=np.float64):
+        super().__init__(dtype)
+        self.meta_file = meta_file
+        self._loaded = {}
+
+    def append(self, subarea, storm, offset, length):
+        """Add the location of the data rows of a hydrograph block.
+
+        Args:
+            subarea (str): subarea name.
+            storm (str): storm name.
+            offset (int): byte offset of the first data row.
+            length (int): length in bytes of the data rows.
+        """
+        if (subarea, storm) not in self._index:
+            self._subareas[subarea].append(storm)
+        self._index[(subarea, storm)] = (offset, length)
+
+    def finalise(self):
+        pass
+
+    def hydrograph(self, subarea, storm):
+        """(results column x time step) view of a single hydrograph."""
+        key = (subarea, storm)
+        if key not in self._loaded:
+            offset, length = self._index[key]
+            with open(self.meta_file, "rb") as infile:
+                infile.seek(offset)
+                chunk = infile.read(length)
+            self._loaded[key] = np.ascontiguousarray(
+                _decode_hydrograph(chunk, self.dtype).T
+            )
+        return self._loaded[key]
+
+
+def _parse_meta_file(
+    meta_file,
+    peaks=True,
+    hydrographs=True,
+    feedback=None,
+    dtype=np.float64,
+    start=0,
+    stop=None,
+):
+    """Parse the peak summary and/or hydrograph blocks of a _Meta.out file.
+
+    Both block types are collected in the same pass through the file, so a
+    caller that needs both only reads it once. Each line is classified by its
+    prefix, and only the data rows inside a block are split into values.
+
+    Args:
+        meta_file (str): path to the WBNM _Meta.out file.
+        peaks (bool, optional): collect peak summary blocks. Defaults to True.
+        hydrographs (bool, optional): collect hydrograph blocks. Defaults to True.
+        feedback (QgsFeedback, optional): given the percentage of the file
+            read so far, and checked for cancellation. Defaults to None.
+        dtype (optional): floating point type of the stored hydrographs.
+            Defaults to np.float64.
+        start (int, optional): byte offset to start parsing from, which must
+            be the start of a line. Defaults to 0.
+        stop (int, optional): byte offset to stop parsing at, which must be
+            the start of a line outside any block. Defaults to the end of file.
+
+    Returns:
+        tuple: _PeakResults and HydrographStore.
+    """
+    if stop is None:
+        stop = os.path.getsize(meta_file)
+    range_size = (stop - start) or 1
+    position = start
+    percent = 0
 
     peak_block = False
-    with open(meta_file, "r") as infile:
-        results = []
+    hydrograph_block = False
+    peak_results = _PeakResults()
+    hydrograph_results = HydrographStore(dtype)
+    with open(meta_file, "rb") as infile:
+        infile.seek(start)
         for line in infile:
-            peak_start_match = peak_start_pattern.findall(line)
-            if peak_start_match:
-                peak_block = True
-                storm_dict = dict(zip(storm_columns, peak_start_match[0]))
-                continue
-            if peak_block:
-                peak_end_match = peak_end_pattern.findall(line)
-                if peak_end_match:
+            if position >= stop:
+                break
+            position += len(line)
+            if hydrograph_block:
+                if line.lstrip()[:1].isdigit():
+                    # store line of hydrograph
+                    hydrograph_lines.append(line)
+                elif line.startswith(BLOCK_END):
+                    # process and compile hydrograph
+                    hydrograph_block = False
+                    hydrograph_results.append(
+                        hydrograph_dict["subarea"],
+                        hydrograph_dict["storm"],
+                        _decode_hydrograph(b"".join(hydrograph_lines), dtype),
+                    )
+            elif peak_block:
+                if line.startswith(BLOCK_END):
                     peak_block = False
-                    continue
-            if peak_block:
-                peak_results_match = peak_results_pattern.findall(line)
-                if peak_results_match:
-                    peak_results_dict = dict(
-                        zip(peak_results_types, peak_results_match[0])
+                    peak_results.parse_rows(peak_lines)
+                else:
+                    peak_lines.append(line)
+            elif hydrographs and line.startswith(HYDROGRAPH_START):
+                header = _parse_header(HYDROGRAPH_START_PATTERN, line)
+                if header:
+                    # update progress
+                    if 100 * (position - start) // range_size > percent:
+                        percent = 100 * (position - start) // range_size
+                        _report_progress(feedback, percent)
+                    # initialise hydrograph
+                    hydrograph_block = True
+                    hydrograph_dict = dict(zip(HYDROGRAPH_COLUMNS, header))
+                    hydrograph_lines = []
+            elif peaks and line.startswith(PEAK_START):
+                header = _parse_header(PEAK_START_PATTERN, line)
+                if header:
+                    peak_block = True
+                    peak_results.add_storm(header)
+                    peak_lines = []
+
+    hydrograph_results.finalise()
+    _report_progress(feedback, 100)
+
+    return peak_results, hydrograph_results
+
+
+def _block_ranges(meta_file, chunk_size=CHUNK_SIZE):
+    """Split a _Meta.out file into byte ranges that start on a block marker.
+
+    Each range is roughly chunk_size bytes long, and never splits a block, so
+    the ranges can be parsed independently of each other.
+
+    Args:
+        meta_file (str): path to the WBNM _Meta.out file.
+        chunk_size (int, optional): target size in bytes of each range.
+            Defaults to CHUNK_SIZE.
+
+    Returns:
+        list: (start, stop) byte offsets covering the whole file.
+    """
+    file_size = os.path.getsize(meta_file)
+    if file_size == 0:
+        return []
+
+    boundaries = [0]
+    with open(meta_file, "rb") as infile, mmap.mmap(
+        infile.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        while boundaries[-1] + chunk_size < file_size:
+            boundary = mm.find(b"\n" + BLOCK_START, boundaries[-1] + chunk_size)
+            if boundary == -1:
+                break
+            boundaries.append(boundary + 1)
+    boundaries.append(file_size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _parse_meta_file_parallel(
+    meta_file,
+    peaks=True,
+    hydrographs=True,
+    feedback=None,
+    dtype=np.float64,
+    workers=None,
+    chunk_size=CHUNK_SIZE,
+):
+    """Parse a _Meta.out file with a pool of worker processes.
+
+    The file is split into byte ranges on block boundaries, each range is
+    parsed by _parse_meta_file in a worker process, and the results are joined
+    back together in file order, so the output is the same as a serial parse.
+
+    Worker processes are started with the current Python interpreter, so this
+    is meant for use from scripts rather than from inside QGIS.
+
+    Args:
+        meta_file (str): path to the WBNM _Meta.out file.
+        peaks (bool, optional): collect peak summary blocks. Defaults to True.
+        hydrographs (bool, optional): collect hydrograph blocks. Defaults to True.
+        feedback (QgsFeedback, optional): given the percentage of the file
+            parsed so far, and checked for cancellation, as each range
+            completes. Defaults to None.
+        dtype (optional): floating point type of the stored hydrographs.
+            Defaults to np.float64.
+        workers (int, optional): number of worker processes. Defaults to the
+            number of processors.
+        chunk_size (int, optional): target size in bytes of the range given
+            to each worker. Defaults to CHUNK_SIZE.
+
+    Returns:
+        tuple: _PeakResults and HydrographStore.
+    """
+    ranges = _block_ranges(meta_file, chunk_size)
+    file_size = os.path.getsize(meta_file) or 1
+    results = [None] * len(ranges)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                _parse_meta_file,
+                meta_file,
+                peaks,
+                hydrographs,
+                None,
+                dtype,
+                start,
+                stop,
+            ): i
+            for i, (start, stop) in enumerate(ranges)
+        }
+        parsed = 0
+        try:
+            for future in as_completed(futures):
+                i = futures[future]
+                results[i] = future.result()
+                # update progress
+                parsed += ranges[i][1] - ranges[i][0]
+                _report_progress(feedback, 100 * parsed / file_size)
+        except ParseCanceled:
+            # don't start the ranges that are still queued
+            for future in futures:
+                future.cancel()
+            raise
+
+    peak_results = _PeakResults()
+    hydrograph_results = HydrographStore(dtype)
+    for range_peak_results, range_hydrograph_results in results:
+        peak_results.extend(range_peak_results)
+        hydrograph_results.extend(range_hydrograph_results)
+    hydrograph_results.finalise()
+    _report_progress(feedback, 100)
+
+    return peak_results, hydrograph_results
+
+
+def _find_data_start(mm, start, end):
+    """Byte offset of the first data row between start and end of a block."""
+    while start < end:
+        line_end = mm.find(b"\n", start, end)
+        if line_end == -1:
+            line_end = end
+        if mm[start:line_end].lstrip()[:1].isdigit():
+            break
+        start = line_end + 1
+    return min(start, end)
+
+
+def _index_meta_file(meta_file, feedback=None, dtype=np.float64):
+    """Index the blocks of a _Meta.out file without decoding the hydrographs.
+
+    The file is memory mapped and searched for block markers, so the data rows
+    of the hydrograph blocks are skipped over rather than read line by line.
+    Peak summary blocks are parsed as they are found.
+
+    Args:
+        meta_file (str): path to the WBNM _Meta.out file.
+        feedback (QgsFeedback, optional): given the percentage of the file
+            indexed so far, and checked for cancellation. Defaults to None.
+        dtype (optional): floating point type of the decoded hydrographs.
+            Defaults to np.float64.
+
+    Returns:
+        tuple: _PeakResults and LazyHydrographStore.
+    """
+    peak_results = _PeakResults()
+    hydrograph_results = LazyHydrographStore(meta_file, dtype)
+    if os.path.getsize(meta_file) == 0:
+        return peak_results, hydrograph_results
+
+    percent = 0
+    with open(meta_file, "rb") as infile, mmap.mmap(
+        infile.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        file_size = len(mm)
+        position = mm.find(BLOCK_START)
+        while position != -1:
+            line_end = mm.find(b"\n", position)
+            if line_end == -1:
+                break
+            end = mm.find(BLOCK_END, line_end)
+            if end == -1:
+                break
+            line = mm[position:line_end]
+            if line.startswith(HYDROGRAPH_START):
+                header = _parse_header(HYDROGRAPH_START_PATTERN, line)
+                if header:
+                    hydrograph_dict = dict(zip(HYDROGRAPH_COLUMNS, header))
+                    data_start = _find_data_start(mm, line_end + 1, end)
+                    hydrograph_results.append(
+                        hydrograph_dict["subarea"],
+                        hydrograph_dict["storm"],
+                        data_start,
+                        end - data_start,
                     )
-                    storm_dict["subarea"] = peak_results_dict.pop("subarea")
-                    for variable, value in peak_results_dict.items():
-                        results.append(
-                            {**storm_dict, "variable": variable, "value": value}
-                        )
-
-    storms_df = pd.DataFrame(results)
-    # storms_df.dur = storms_df.dur.astype(float)
-    storms_df.value = storms_df.value.astype(float)
-    return storms_df
-
-
-def get_hydrographs(meta_file, progress=None):
-
-    hydrograph_columns = ["subarea", "storm", "id", "aep", "dur", "ens", "type"]
-    results_columns = [
-        "Time",
-        "Rain",
-        "Rainperv",
-        "Qtop",
-        "Qbot",
-        "Qper",
-        "Qimp",
-        "Qinto_OS",
-        "Qout_OS",
-        "Stage",
+                    position = end
+            elif line.startswith(PEAK_START):
+                header = _parse_header(PEAK_START_PATTERN, line)
+                if header:
+                    peak_results.add_storm(header)
+                    peak_results.parse_rows(mm[line_end + 1 : end].splitlines())
+                    position = end
+            # update progress
+            if 100 * position // file_size > percent:
+                percent = 100 * position // file_size
+                _report_progress(feedback, percent)
+            position = mm.find(BLOCK_START, max(position, line_end))
+
+    _report_progress(feedback, 100)
+
+    return peak_results, hydrograph_results
+
+
+def _file_signature(meta_file):
+    """Size, modification time and content hash identifying a _Meta.out file.
+
+    Only the first and last HASH_SAMPLE_SIZE bytes are hashed, so that
+    checking a multi-gigabyte file stays quick.
+    """
+    stat = os.stat(meta_file)
+    content_hash = hashlib.blake2b(digest_size=16)
+    with open(meta_file, "rb") as infile:
+        content_hash.update(infile.read(HASH_SAMPLE_SIZE))
+        if stat.st_size > HASH_SAMPLE_SIZE:
+            infile.seek(max(HASH_SAMPLE_SIZE, stat.st_size - HASH_SAMPLE_SIZE))
+            content_hash.update(infile.read())
+    return {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "hash": content_hash.hexdigest(),
+    }
+
+
+def _cache_paths(meta_file, kind):
+    """Paths of the JSON index and .npz arrays of a cache next to meta_file."""
+    return f"{meta_file}.{kind}.json", f"{meta_file}.{kind}.npz"
+
+
+def _table_arrays(name, table, arrays):
+    """Add the columns of a table to the arrays of a cache.
+
+    Numeric columns are saved as they are, and other columns as categorical
+    codes and categories.
+
+    Returns:
+        list: (column, encoding) of each column, for _table_from_arrays.
+    """
+    columns = []
+    for column in table.columns:
+        if pd.api.types.is_numeric_dtype(table[column]):
+            arrays[f"{name}.{column}"] = table[column].to_numpy()
+            columns.append((column, "values"))
+        else:
+            categorical = pd.Categorical(table[column])
+            arrays[f"{name}.{column}.codes"] = categorical.codes
+            arrays[f"{name}.{column}.categories"] = np.array(
+                categorical.categories, dtype=str
+            )
+            columns.append((column, "category"))
+    return columns
+
+
+def _table_from_arrays(name, columns, arrays):
+    """Rebuild a table saved by _table_arrays."""
+    return pd.DataFrame(
+        {
+            column: (
+                pd.Categorical.from_codes(
+                    arrays[f"{name}.{column}.codes"],
+                    arrays[f"{name}.{column}.categories"].astype(object),
+                )
+                if encoding == "category"
+                else arrays[f"{name}.{column}"]
+            )
+            for column, encoding in columns
+        }
+    )
+
+
+def _read_cache(meta_file, kind, signature, hydrographs):
+    """Load cached results if the cache matches the current _Meta.out file.
+
+    Args:
+        meta_file (str): path to the WBNM _Meta.out file.
+        kind (str): "results" for a HydrographStore or "index" for a
+            LazyHydrographStore.
+        signature (dict): current signature of the file from _file_signature.
+        hydrographs (HydrographStore): empty store to load the cache into.
+
+    Returns:
+        tuple: cached peaks and peaks summary DataFrames, or None if there is
+            no valid cache.
+    """
+    index_path, arrays_path = _cache_paths(meta_file, kind)
+    try:
+        with open(index_path, "r") as index_file:
+            index = json.load(index_file)
+        if (
+            index.get("version") != CACHE_VERSION
+            or index.get("signature") != signature
+            or index.get("dtype") != hydrographs.dtype.str
+        ):
+            return None
+        with np.load(arrays_path, allow_pickle=False) as arrays:
+            peaks = _table_from_arrays("peaks", index["columns"]["peaks"], arrays)
+            summary = _table_from_arrays(
+                "summary", index["columns"]["summary"], arrays
+            ).set_index(SUMMARY_INDEX_LEVELS)
+            hydrographs.load_arrays(
+                {
+                    key: arrays[f"hydrographs.{key}"]
+                    for key in ("subareas", "storms", "locations", "data")
+                }
+            )
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+    return peaks, summary
+
+
+def _write_cache(meta_file, kind, signature, peaks, summary, hydrographs):
+    """Save parsed results next to meta_file for _read_cache.
+
+    The cache is only a speed up, so a cache that can't be written (e.g. to a
+    read only directory) is skipped.
+    """
+    index_path, arrays_path = _cache_paths(meta_file, kind)
+    arrays = {
+        f"hydrographs.{key}": values for key, values in hydrographs.to_arrays().items()
+    }
+    columns = {
+        "peaks": _table_arrays("peaks", peaks, arrays),
+        "summary": _table_arrays("summary", summary.reset_index(), arrays),
+    }
+    index = {
+        "version": CACHE_VERSION,
+        "signature": signature,
+        "dtype": hydrographs.dtype.str,
+        "columns": columns,
+    }
+    try:
+        # write the arrays before the index, so a partly written cache is
+        # never treated as valid
+        with open(arrays_path + ".tmp", "wb") as arrays_file:
+            np.savez(arrays_file, **arrays)
+        os.replace(arrays_path + ".tmp", arrays_path)
+        with open(index_path, "w") as index_file:
+            json.dump(index, index_file)
+    except OSError:
+        pass
+
+
+def _categorical(values):
+    """Categorical of values, with its categories in sorted order."""
+    codes, categories = pd.factorize(np.asarray(values, dtype=object), sort=True)
+    return codes, categories
+
+
+def _peaks_dataframe(peak_results, wide=False):
+    """Build the peaks table from the arrays collected while parsing.
+
+    The repeated text keys are categoricals and aep and dur are numeric.
+
+    Args:
+        peak_results (_PeakResults): parsed peak summary rows.
+        wide (bool, optional): give one column per variable, rather than one
+            row per variable with the result in a "value" column.
+            Defaults to False.
+
+    Returns:
+        DataFrame: peaks table.
+    """
+    storm_rows = np.frombuffer(peak_results.storm_rows, dtype=np.int64)
+    values = np.frombuffer(peak_results.values, dtype=np.float64).reshape(
+        -1, len(PEAK_VARIABLES)
+    )
+    storms = pd.DataFrame(peak_results.storms, columns=STORM_COLUMNS, dtype=object)
+    repeats = 1 if wide else len(PEAK_VARIABLES)
+
+    columns = {}
+    for column in STORM_COLUMNS:
+        if column in ("aep", "dur"):
+            numeric = pd.to_numeric(storms[column]).to_numpy()
+            if column == "aep":
+                numeric = numeric.astype(float)
+            columns[column] = np.repeat(numeric[storm_rows], repeats)
+        else:
+            codes, categories = _categorical(storms[column])
+            columns[column] = pd.Categorical.from_codes(
+                np.repeat(codes[storm_rows], repeats), categories
+            )
+    codes, categories = _categorical(peak_results.subareas)
+    columns["subarea"] = pd.Categorical.from_codes(
+        np.repeat(codes, repeats), categories
+    )
+
+    if wide:
+        for i, variable in enumerate(PEAK_VARIABLES):
+            columns[variable] = values[:, i]
+    else:
+        columns["variable"] = pd.Categorical.from_codes(
+            np.tile(np.arange(len(PEAK_VARIABLES)), len(values)), PEAK_VARIABLES
+        )
+        columns["value"] = values.ravel()
+
+    return pd.DataFrame(columns)
+
+
+def index_peaks(peaks):
+    """Index a long layout peaks table for quick lookups.
+
+    The table is indexed and sorted by subarea, variable, aep and dur, so the
+    peaks of a subarea and variable for an AEP, or an AEP and duration, are a
+    contiguous slice found by binary search, e.g.
+    indexed.loc[("WollA", "out", 1.0), "value"], rather than a scan of the
+    whole table.
+
+    Args:
+        peaks (DataFrame): peaks table from get_peaks or get_results.
+
+    Returns:
+        DataFrame: indexed peaks table.
+    """
+    return peaks.set_index(PEAK_INDEX_LEVELS).sort_index()
+
+
+def summarise_peaks(peaks, variable="out"):
+    """Summarise the ensemble of peaks of each subarea, AEP and duration.
+
+    All the statistics are found in one pass grouping the whole table, so the
+    box plot and critical duration of any subarea and AEP are a lookup.
+
+    Args:
+        peaks (DataFrame): long layout peaks table from get_peaks or
+            get_results.
+        variable (str, optional): peak variable to summarise.
+            Defaults to "out".
+
+    Returns:
+        DataFrame: indexed and sorted by subarea, aep and dur, with the count,
+            mean, min, q1, median, q3 and max of the peaks, and the storm
+            whose peak is nearest the median and its peak, storm_value.
+    """
+    selection = peaks[peaks["variable"] == variable]
+    values = selection["value"]
+    grouped = values.groupby(
+        [selection[level] for level in SUMMARY_INDEX_LEVELS], observed=True
+    )
+    summary = pd.DataFrame(
+        {
+            "count": grouped.count(),
+            "mean": grouped.mean(),
+            "min": grouped.min(),
+            "q1": grouped.quantile(0.25),
+            "median": grouped.median(),
+            "q3": grouped.quantile(0.75),
+            "max": grouped.max(),
+        }
+    )
+    summary.index.names = SUMMARY_INDEX_LEVELS
+
+    # groups are numbered in the sorted order of the summary
+    groups = grouped.ngroup().to_numpy()
+    values = values.to_numpy()
+    distances = np.abs(values - summary["median"].to_numpy()[groups])
+    distances[np.isnan(distances)] = np.inf
+    # the first row of each group, by distance from the median then table order
+    order = np.lexsort((distances, groups))
+    _, first = np.unique(groups[order], return_index=True)
+    nearest = order[first]
+    summary["storm"] = selection["storm"].array.take(nearest)
+    summary["storm_value"] = values[nearest]
+    return summary
+
+
+def critical_durations(summary):
+    """Find the critical duration of each subarea and AEP.
+
+    The critical duration is the one with the highest median peak, and the
+    shortest of them if more than one has it.
+
+    Args:
+        summary (DataFrame): peaks summary from summarise_peaks.
+
+    Returns:
+        DataFrame: indexed by subarea and aep, with the critical dur, its
+            median peak, and its representative storm, the one whose peak is
+            nearest the median, and that peak, storm_value.
+    """
+    critical = (
+        summary.reset_index()
+        .sort_values(
+            ["subarea", "aep", "median"],
+            ascending=[True, True, False],
+            kind="stable",
+        )
+        .drop_duplicates(["subarea", "aep"])
+    )
+    return critical.set_index(["subarea", "aep"])[
+        ["dur", "median", "storm", "storm_value"]
     ]
-    hydrograph_start_pattern = re.compile(
-        r"""
-        .+START_HYDROGRAPHS_    # start of line
-        (\S+)\s*::              # sub area
-        (?=(.+-.+-.+-.+))       # storm
-        (.+)-                   # id
-        (.+)-                   # aep
-        (.+)-                   # dur
-        (.+)                    # ens
-        \((.+)\)                # type
-        """,
-        re.X,
+
+
+def _parse(meta_file, workers=1, chunk_size=CHUNK_SIZE, **kwargs):
+    """Parse a _Meta.out file in this process, or in parallel if workers != 1."""
+    if workers == 1:
+        return _parse_meta_file(meta_file, **kwargs)
+    return _parse_meta_file_parallel(
+        meta_file, workers=workers, chunk_size=chunk_size, **kwargs
     )
-    hydrograph_results_pattern = re.compile(
-        r"""
-        (\d+\.?\d*)\s+  # Time
-        (\d+\.?\d*)\s+  # Rain
-        (\d+\.?\d*)\s+  # Rainperv
-        (\d+\.?\d*)\s+  # Qtop
-        (\d+\.?\d*)\s+  # Qbot
-        (\d+\.?\d*)\s+  # Qper
-        (\d+\.?\d*)\s+  # Qimp
-        (\d+\.?\d*)\s+  # Qinto_OS
-        (\d+\.?\d*)\s+  # Qout_OS
-        (\d+\.?\d*)     # Stage
-        """,
-        re.X,
+
+
+def _results(peaks, peaks_summary, hydrographs, summary):
+    """Results returned by get_results and index_results."""
+    if summary:
+        return peaks, hydrographs, peaks_summary
+    return peaks, hydrographs
+
+
+def get_results(
+    meta_file,
+    feedback=None,
+    dtype=np.float64,
+    cache=True,
+    workers=1,
+    chunk_size=CHUNK_SIZE,
+    summary=False,
+):
+    """Read the peaks and hydrographs from a _Meta.out file in a single pass.
+
+    Unless cache is False, the results and their summary from summarise_peaks
+    are saved to a cache next to the file and reused while the file is
+    unchanged.
+
+    Args:
+        meta_file (str): path to the WBNM _Meta.out file.
+        feedback (QgsFeedback, optional): given the percentage of the file
+            read so far, and checked for cancellation. Defaults to None.
+        dtype (optional): floating point type of the stored hydrographs.
+            Defaults to np.float64.
+        cache (bool, optional): read and write the results cache.
+            Defaults to True.
+        workers (int, optional): number of processes to parse with. 1 parses
+            in this process, None uses one per processor. Defaults to 1.
+        chunk_size (int, optional): target size in bytes of the part of the
+            file given to each worker process. Defaults to CHUNK_SIZE.
+        summary (bool, optional): also return the peaks summary.
+            Defaults to False.
+
+    Returns:
+        tuple: peaks DataFrame and HydrographStore, and the peaks summary
+            DataFrame if summary is True.
+    """
+    if cache:
+        signature = _file_signature(meta_file)
+        hydrographs = HydrographStore(dtype)
+        cached = _read_cache(meta_file, "results", signature, hydrographs)
+        if cached is not None:
+            return _results(*cached, hydrographs, summary)
+
+    peak_results, hydrographs = _parse(
+        meta_file,
+        workers=workers,
+        chunk_size=chunk_size,
+        feedback=feedback,
+        dtype=dtype,
     )
-    hydrograph_end_pattern = re.compile(r"#####END_HYDROGRAPHS_")
+    peaks = _peaks_dataframe(peak_results)
+    peaks_summary = summarise_peaks(peaks) if cache or summary else None
+    if cache:
+        _write_cache(meta_file, "results", signature, peaks, peaks_summary, hydrographs)
+    return _results(peaks, peaks_summary, hydrographs, summary)
 
-    hydrograph_no = 0
 
-    hydrograph_block = False
-    with open(meta_file, "r") as infile:
-        hydrographs = defaultdict(dict)
-        for line in infile:
-            hydrograph_start_match = hydrograph_start_pattern.findall(line)
-            if hydrograph_start_match:
-                # update progress bar
-                if progress:
-                    progress.setValue(hydrograph_no)
-                # initialise hydrograph
-                hydrograph_block = True
-                hydrograph_dict = dict(
-                    zip(hydrograph_columns, hydrograph_start_match[0])
-                )
-                hydrograph = defaultdict(list)
-                continue
-            if hydrograph_block:
-                hydrograph_end_match = hydrograph_end_pattern.findall(line)
-                if hydrograph_end_match:
-                    # process and compile hydrograph
-                    hydrograph_block = False
-                    hydrographs[hydrograph_dict["subarea"]][
-                        hydrograph_dict["storm"]
-                    ] = hydrograph
-                    hydrograph_no += 1
-                    continue
-            if hydrograph_block:
-                hydrograph_results_match = hydrograph_results_pattern.findall(line)
-                if hydrograph_results_match:
-                    # store line of hydrograph
-                    for i, r in enumerate(results_columns):
-                        hydrograph[r].append(float(hydrograph_results_match[0][i]))
+def index_results(
+    meta_file, feedback=None, dtype=np.float64, cache=True, summary=False
+):
+    """Read the peaks from a _Meta.out file and index its hydrographs.
 
+    Only the block markers and peak summaries are read, so this is much
+    quicker than get_results for large files. Hydrographs are decoded from the
+    file on demand by the returned LazyHydrographStore. Unless cache is False,
+    the index and the peaks summary from summarise_peaks are saved to a cache
+    next to the file and reused while the file is unchanged.
+
+    Args:
+        meta_file (str): path to the WBNM _Meta.out file.
+        feedback (QgsFeedback, optional): given the percentage of the file
+            indexed so far, and checked for cancellation. Defaults to None.
+        dtype (optional): floating point type of the decoded hydrographs.
+            Defaults to np.float64.
+        cache (bool, optional): read and write the index cache.
+            Defaults to True.
+        summary (bool, optional): also return the peaks summary.
+            Defaults to False.
+
+    Returns:
+        tuple: peaks DataFrame and LazyHydrographStore, and the peaks summary
+            DataFrame if summary is True.
+    """
+    if cache:
+        signature = _file_signature(meta_file)
+        hydrographs = LazyHydrographStore(meta_file, dtype)
+        cached = _read_cache(meta_file, "index", signature, hydrographs)
+        if cached is not None:
+            return _results(*cached, hydrographs, summary)
+
+    peak_results, hydrographs = _index_meta_file(
+        meta_file, feedback=feedback, dtype=dtype
+    )
+    peaks = _peaks_dataframe(peak_results)
+    peaks_summary = summarise_peaks(peaks) if cache or summary else None
+    if cache:
+        _write_cache(meta_file, "index", signature, peaks, peaks_summary, hydrographs)
+    return _results(peaks, peaks_summary, hydrographs, summary)
+
+
+def get_peaks(meta_file, workers=1, chunk_size=CHUNK_SIZE, wide=False):
+    peak_results, _ = _parse(
+        meta_file, workers=workers, chunk_size=chunk_size, hydrographs=False
+    )
+    return _peaks_dataframe(peak_results, wide=wide)
+
+
+def get_hydrographs(
+    meta_file, feedback=None, dtype=np.float64, workers=1, chunk_size=CHUNK_SIZE
+):
+    _, hydrographs = _parse(
+        meta_file,
+        workers=workers,
+        chunk_size=chunk_size,
+        peaks=False,
+        feedback=feedback,
+        dtype=dtype,
+    )
     return hydrographs
 
 
+def _remove_peaks(peaks_path):
+    """Remove the Parquet parts of a previous export from a peaks directory.
+
+    Only files named like those written by _write_peaks, and partition
+    directories left empty by removing them, are removed.
+    """
+    for root, _, files in os.walk(peaks_path, topdown=False):
+        for name in files:
+            if name.startswith("part-") and name.endswith(".parquet"):
+                os.remove(os.path.join(root, name))
+        if root != peaks_path and not os.listdir(root):
+            os.rmdir(root)
+
+
+def _write_peaks(peaks, peaks_path, partition_cols, part):
+    """Add a table of peaks to a partitioned Parquet dataset."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # text columns are written as plain strings, as the categories of each
+    # part of the file differ
+    peaks = peaks.astype(
+        {
+            column: str
+            for column in peaks.columns
+            if not pd.api.types.is_numeric_dtype(peaks[column])
+        }
+    )
+    pq.write_to_dataset(
+        pa.Table.from_pandas(peaks, preserve_index=False),
+        peaks_path,
+        partition_cols=list(partition_cols),
+        basename_template="part-{:05d}-{{i}}.parquet".format(part),
+    )
+
+
+class _HydrographWriter:
+    """Append hydrographs to an HDF5 file, in the layout of HydrographStore.
+
+    The file holds a (results column x time step) "data" dataset, with the
+    results column names in its "columns" attribute, and "subareas",
+    "storms" and "locations" datasets giving the subarea, storm and
+    [start, stop) time steps of each hydrograph. Every dataset grows as
+    hydrographs are appended, and data is chunked along the time steps and
+    compressed.
+    """
+
+    def __init__(self, hydrographs_path, dtype):
+        import h5py
+
+        self._file = h5py.File(hydrographs_path, "w")
+        self._data = self._file.create_dataset(
+            "data",
+            shape=(len(RESULTS_COLUMNS), 0),
+            maxshape=(len(RESULTS_COLUMNS), None),
+            chunks=(len(RESULTS_COLUMNS), HDF5_CHUNK_STEPS),
+            dtype=dtype,
+            compression="gzip",
+            shuffle=True,
+        )
+        self._data.attrs["columns"] = RESULTS_COLUMNS
+        string = h5py.string_dtype()
+        self._subareas = self._file.create_dataset(
+            "subareas", shape=(0,), maxshape=(None,), dtype=string, chunks=True
+        )
+        self._storms = self._file.create_dataset(
+            "storms", shape=(0,), maxshape=(None,), dtype=string, chunks=True
+        )
+        self._locations = self._file.create_dataset(
+            "locations", shape=(0, 2), maxshape=(None, 2), dtype=np.int64, chunks=True
+        )
+
+    def append(self, hydrographs):
+        """Append the hydrographs of a HydrographStore."""
+        arrays = hydrographs.to_arrays()
+        steps = self._data.shape[1]
+        new_steps = arrays["data"].shape[1]
+        self._data.resize(steps + new_steps, axis=1)
+        self._data[:, steps:] = arrays["data"]
+
+        count = self._locations.shape[0]
+        new_count = len(arrays["locations"])
+        for dataset in (self._subareas, self._storms, self._locations):
+            dataset.resize(count + new_count, axis=0)
+        self._subareas[count:] = arrays["subareas"].astype(object)
+        self._storms[count:] = arrays["storms"].astype(object)
+        self._locations[count:] = arrays["locations"] + steps
+
+    def close(self):
+        self._file.close()
+
+
+def export_results(
+    meta_file,
+    peaks_path=None,
+    hydrographs_path=None,
+    partition_cols=("aep", "dur"),
+    feedback=None,
+    dtype=np.float64,
+    chunk_size=CHUNK_SIZE,
+):
+    """Export the peaks and hydrographs of a _Meta.out file for other tools.
+
+    The file is read a part at a time, and the peaks and hydrographs of each
+    part are written out before the next is read, so the memory used depends
+    on chunk_size rather than the size of the file.
+
+    The peaks are written as a Parquet dataset, partitioned into directories
+    by partition_cols, in the long layout of get_peaks. The parts of any
+    previous export to the same directory are removed first, as the HDF5 file
+    is replaced. The partition column
+    types are only kept in the directory names, e.g. "aep=0.5", so give them
+    to the reader, e.g. pyarrow.dataset.partitioning(schema, flavor="hive"),
+    to read them back as numbers.
+
+    The hydrographs are written to an HDF5 file holding a (results column x
+    time step) "data" dataset, and "subareas", "storms" and "locations"
+    datasets giving the [start, stop) time steps of the hydrograph of each
+    subarea and storm.
+
+    Writing Parquet needs pyarrow and writing HDF5 needs h5py.
+
+    Args:
+        meta_file (str): path to the WBNM _Meta.out file.
+        peaks_path (str, optional): directory to write the Parquet dataset
+            of peaks to. Defaults to None, to not export peaks.
+        hydrographs_path (str, optional): path of the HDF5 file to write the
+            hydrographs to. Defaults to None, to not export hydrographs.
+        partition_cols (tuple, optional): peaks columns to partition the
+            Parquet dataset by. Defaults to ("aep", "dur").
+        feedback (QgsFeedback, optional): given the percentage of the file
+            exported so far, and checked for cancellation. Defaults to None.
+        dtype (optional): floating point type of the exported hydrographs.
+            Defaults to np.float64.
+        chunk_size (int, optional): target size in bytes of each part of the
+            file read. Defaults to CHUNK_SIZE.
+    """
+    file_size = os.path.getsize(meta_file)
+    if peaks_path is not None:
+        _remove_peaks(peaks_path)
+    writer = (
+        _HydrographWriter(hydrographs_path, dtype)
+        if hydrographs_path is not None
+        else None
+    )
+    try:
+        for part, (start, stop) in enumerate(_block_ranges(meta_file, chunk_size)):
+            peak_results, hydrographs = _parse_meta_file(
+                meta_file,
+                peaks=peaks_path is not None,
+                hydrographs=writer is not None,
+                dtype=dtype,
+                start=start,
+                stop=stop,
+            )
+            if peaks_path is not None:
+                _write_peaks(
+                    _peaks_dataframe(peak_results), peaks_path, partition_cols, part
+                )
+            if writer is not None:
+                writer.append(hydrographs)
+            _report_progress(feedback, 100 * stop // file_size)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
 if __name__ == "__main__":
     # %%
-    storms_df = get_peaks(r"D:\03_Work\05_Code\wbnm\murarrie_Meta.out")
+    storms_df, hydrographs = get_results(r"D:\03_Work\05_Code\wbnm\murarrie_Meta.out")
     storms_df.head()
 
     # %%
-    hydrographs = get_hydrographs(r"D:\03_Work\05_Code\wbnm\murarrie_Meta.out")
-    hydrographs.keys()
-
+    hydrographs.subareas
@@ -0,0 +1,45 @@
+import os
+
+from qgis.core import QgsTask
+
+from .wbnm_results_parser import ParseCanceled, index_peaks, index_results
+
+
+class MetaFileTask(QgsTask):
+    """Read a _Meta.out file in the background.
+
+    The peaks are read and the hydrographs indexed by index_results on a QGIS
+    task manager thread, so the QGIS window stays responsive while large files
+    are processed. The peaks are also indexed for plotting with index_peaks,
+    and summarised for each subarea, AEP and duration with summarise_peaks.
+    Progress is reported through the task's progressChanged
+    signal and the task can be canceled. Hydrographs are then read from the
+    file as they are plotted.
+
+    Args:
+        meta_file (str): path to the WBNM _Meta.out file.
+    """
+
+    def __init__(self, meta_file):
+        super().__init__(
+            "Processing {}".format(os.path.basename(meta_file)), QgsTask.CanCancel
+        )
+        self.meta_file = meta_file
+        self.peaks = None
+        self.indexed_peaks = None
+        self.summary = None
+        self.hydrographs = None
+        self.exception = None
+
+    def run(self):
+        try:
+            self.peaks, self.hydrographs, self.summary = index_results(
+                self.meta_file, feedback=self, summary=True
+            )
+            self.indexed_peaks = index_peaks(self.peaks)
+        except ParseCanceled:
+            return False
+        except Exception as e:
+            self.exception = e
+            return False
+        return True
@@ -1,8 +1,17 @@
 import re
+from collections import defaultdict
 from dataclasses import dataclass
 from itertools import zip_longest
 from typing import Optional
 
+import numpy as np
+
+BLOCK_START = '#####START_'
+BLOCK_END = '#####END_'
+# downstream index of subareas draining to the SINK, out of the catchment
+SINK = -1
+SINK_NAME = 'SINK'
+
 
 def grouper(n, iterable, fillvalue=None):
     "grouper(3, 'ABCDEFG', 'x') --> ABC DEF Gxx"
@@ -10,23 +19,224 @@ def grouper(n, iterable, fillvalue=None):
     return zip_longest(fillvalue=fillvalue, *args)
 
 
+def float_table(lines):
+    """Parse lines of whitespace separated numbers as a 2-D float array, one row per line."""
+    if not lines:
+        return np.empty((0, 0))
+    return np.array([line.split() for line in lines], dtype=float).reshape(len(lines), -1)
+
+
+def float_table_or_lines(lines):
+    """Parse lines as with float_table, or if they aren't a table of numbers, strip them.
+
+    Used for layouts not seen in a runfile yet, so one that differs is kept
+    as its lines rather than failing the whole runfile.
+    """
+    lines = [line.strip() for line in lines]
+    try:
+        return float_table(lines)
+    except ValueError:
+        return lines
+
+
+def is_number_line(line):
+    """Whether a line is only whitespace separated numbers."""
+    try:
+        [float(value) for value in line.split()]
+    except ValueError:
+        return False
+    return True
+
+
+def structured_table(columns):
+    """Structured array with a field for each of a dict of equal length arrays."""
+    columns = {name: np.asarray(column) for name, column in columns.items()}
+    length = len(next(iter(columns.values())))
+    table = np.empty(length, dtype=[(name, column.dtype) for name, column in columns.items()])
+    for name, column in columns.items():
+        table[name] = column
+    return table
+
+
+def split_entries(lines, is_start):
+    """Split lines into entries, each starting at a line for which is_start is true."""
+    entries = []
+    for line in lines:
+        if is_start(line) or not entries:
+            entries.append([])
+        entries[-1].append(line)
+    return entries
+
+
+def block_name(line, marker=BLOCK_START):
+    """Name of the block started or ended by a marker line.
+
+    e.g. 'TOPOLOGY_BLOCK' for the line
+    '#####START_TOPOLOGY_BLOCK##########|###########|###########|###########|'
+    or 'OUTLET_STRUCTURE#1' for '#####START_OUTLET_STRUCTURE#1'.
+    """
+    return line[len(marker):].rstrip().rstrip('#|')
+
+
+def iter_blocks(lines):
+    """Find the lines of every block, including nested blocks, in one pass.
+
+    Blocks are given as they end, so nested blocks come before the block they
+    are in, and the lines after a block are only read once the next block is
+    asked for.
+
+    Args:
+        lines (list): lines of a runfile.
+
+    Yields:
+        tuple: path of block names to the block, e.g. ('TOPOLOGY_BLOCK',) or
+            ('OUTLET_STRUCTURES_BLOCK', 'OUTLET_STRUCTURE#1', 'OUTLET_DETAILS'),
+            and the (start, end) indexes of the lines inside the block, not
+            including its START and END lines.
+    """
+    open_blocks = []
+    for i, line in enumerate(lines):
+        if not line.startswith('#####'):
+            continue
+        if line.startswith(BLOCK_START):
+            open_blocks.append((block_name(line), i + 1))
+        elif line.startswith(BLOCK_END) and open_blocks:
+            # end markers don't always repeat the whole start name, e.g.
+            # START_DESIGN_RAIN_ARR2016 is ended by END_DESIGN_RAIN_ARR, so
+            # each end marker closes the innermost open block
+            name, start = open_blocks.pop()
+            path = tuple(open_name for open_name, _ in open_blocks) + (name,)
+            yield path, (start, i)
+
+
+def index_blocks(lines):
+    """Find the lines of every block, including nested blocks.
+
+    Args:
+        lines (list): lines of a runfile.
+
+    Returns:
+        dict: path of block names to the (start, end) indexes of the lines
+            inside each block, as from iter_blocks.
+    """
+    return dict(iter_blocks(lines))
+
+
+def nest_blocks(spans):
+    """Group the spans of nested blocks by the outermost block they are in.
+
+    Args:
+        spans (dict): block spans from index_blocks.
+
+    Returns:
+        dict: name of each outermost block mapped to the spans of the blocks
+            nested in it, keyed by their path below it and relative to its
+            lines.
+    """
+    nested = defaultdict(dict)
+    for path, (start, end) in spans.items():
+        if len(path) > 1:
+            outer_start = spans[path[:1]][0]
+            nested[path[0]][path[1:]] = (start - outer_start, end - outer_start)
+    return nested
+
+
 class Runfile:
+    """A WBNM runfile.
+
+    Only the lines are read when the Runfile is created. Each block is parsed
+    the first time it is used, e.g. runfile.status, and then kept, and the
+    lines are only indexed as far as the end of the blocks used so far, so
+    reading one field near the top of a runfile doesn't parse the rest of it.
+    """
 
     def __init__(self, file_path):
         self.file_path = file_path
         self.contents = self.read()
-        self.preamble = PreambleBlock(self.contents)
-        self.status = StatusBlock(self.contents)
-        self.display = DisplayBlock(self.contents)
-        self.topology = TopologyBlock(self.contents)
-        self.surfaces = SurfacesBlock(self.contents)
-        self.flowpaths = FlowpathsBlock(self.contents)
+        self._spans = {}
+        self._unindexed = iter_blocks(self.contents)
+        self._sub_blocks = None
+        self._parsed_blocks = {}
 
     def read(self):
         with open(self.file_path, 'r') as runfile:
             contents = runfile.readlines()
         return contents
 
+    def _find_block(self, path):
+        """Index the lines up to the end of a block, if not already indexed."""
+        while path not in self._spans and self._unindexed is not None:
+            found = next(self._unindexed, None)
+            if found is None:
+                self._unindexed = None
+            else:
+                self._spans[found[0]] = found[1]
+        return self._spans.get(path)
+
+    @property
+    def blocks(self):
+        """Line spans of every block, as from index_blocks."""
+        self._find_block(None)
+        return self._spans
+
+    @property
+    def sub_blocks(self):
+        """Line spans of the nested blocks of each block, from nest_blocks."""
+        if self._sub_blocks is None:
+            self._sub_blocks = nest_blocks(self.blocks)
+        return self._sub_blocks
+
+    def block(self, block_class):
+        """Parse a RunfileBlock subclass from its lines, once."""
+        block = self._parsed_blocks.get(block_class)
+        if block is None:
+            name = block_class.block_name
+            start, end = self._find_block((name,)) or (0, 0)
+            # blocks nested in this one end before it, so are already indexed
+            sub_blocks = {
+                path[1:]: (sub_start - start, sub_end - start)
+                for path, (sub_start, sub_end) in self._spans.items()
+                if len(path) > 1 and path[0] == name}
+            block = block_class(self.contents[start:end], sub_blocks)
+            self._parsed_blocks[block_class] = block
+        return block
+
+    @property
+    def preamble(self):
+        return self.block(PreambleBlock)
+
+    @property
+    def status(self):
+        return self.block(StatusBlock)
+
+    @property
+    def display(self):
+        return self.block(DisplayBlock)
+
+    @property
+    def topology(self):
+        return self.block(TopologyBlock)
+
+    @property
+    def surfaces(self):
+        return self.block(SurfacesBlock)
+
+    @property
+    def flowpaths(self):
+        return self.block(FlowpathsBlock)
+
+    @property
+    def local_structures(self):
+        return self.block(LocalStructuresBlock)
+
+    @property
+    def outlet_structures(self):
+        return self.block(OutletStructuresBlock)
+
+    @property
+    def storms(self):
+        return self.block(StormBlock)
+
     # def commit(self):
     #     with open(self.file_path, 'w') as runfile:
     #         self.preamble.write()
@@ -34,53 +244,62 @@ class Runfile:
 
 
 class RunfileBlock:
+    """Lines of a block of a runfile, between its START and END lines.
+
+    Args:
+        block_contents (list): lines inside the block.
+        sub_blocks (dict, optional): path of names of each block nested in
+            this one, mapped to the (start, end) indexes of its lines in
+            block_contents, as from index_blocks. Defaults to None.
+    """
 
+    block_name = 'BLOCK'
     start_line = 'STARTLINE'
     end_line = 'ENDLINE'
 
-    def __init__(self, runfile_contents):
-        self.runfile_contents = runfile_contents
-        self.block_contents = self.read()
+    def __init__(self, block_contents, sub_blocks=None):
+        self.block_contents = block_contents
+        self.sub_blocks = sub_blocks if sub_blocks is not None else {}
+        self._nested_blocks = None
 
-    def read(self):
-        start = re.compile(re.escape(self.start_line))
-        end = re.compile(re.escape(self.end_line))
-        block_contents = []
-        inside_block = False
-        for line in self.runfile_contents:
-            if inside_block:
-                if re.match(end, line):
-                    inside_block = False
-                else:
-                    block_contents.append(line)
-            elif re.match(start, line):
-                inside_block = True
-        return block_contents
+    def sub_block(self, *path):
+        """Lines of a nested block, e.g. sub_block('OUTLET_STRUCTURE#1')."""
+        start, end = self.sub_blocks[path]
+        return self.block_contents[start:end]
+
+    def sub_block_spans(self, name):
+        """Spans of the blocks nested in a nested block, relative to its lines."""
+        if self._nested_blocks is None:
+            self._nested_blocks = nest_blocks(self.sub_blocks)
+        return self._nested_blocks.get(name, {})
 
 
 class PreambleBlock(RunfileBlock):
 
+    block_name = 'PREAMBLE_BLOCK'
     start_line = '#####START_PREAMBLE_BLOCK##########|###########|###########|###########|'
     end_line = '#####END_PREAMBLE_BLOCK############|###########|###########|###########|'
 
 
 class StatusBlock(RunfileBlock):
 
+    block_name = 'STATUS_BLOCK'
     start_line = '#####START_STATUS_BLOCK############|###########|###########|###########|'
     end_line = '#####END_STATUS_BLOCK##############|###########|###########|###########|'
 
-    def __init__(self, runfile_contents):
-        super().__init__(runfile_contents)
-        self.pathname, self.date_last_edit, self.name, selfversion_number = self.block_contents
+    def __init__(self, block_contents, sub_blocks=None):
+        super().__init__(block_contents, sub_blocks)
+        self.pathname, self.date_last_edit, self.name, self.version_number = self.block_contents
 
 
 class DisplayBlock(RunfileBlock):
 
+    block_name = 'DISPLAY_BLOCK'
     start_line = '#####START_DISPLAY_BLOCK###########|###########|###########|###########|'
     end_line = '#####END_DISPLAY_BLOCK#############|###########|###########|###########|'
 
-    def __init__(self, runfile_contents):
-        super().__init__(runfile_contents)
+    def __init__(self, block_contents, sub_blocks=None):
+        super().__init__(block_contents, sub_blocks)
         self.window_coords = self.block_contents[0].split()
         self.gis_map_filename = self.block_contents[1]
         self.map_coords = self.block_contents[2].split()
@@ -97,18 +316,172 @@ class CatchmentTopology:
 
 
 class TopologyBlock(RunfileBlock):
+    """Location of each subarea and the subarea it drains to.
+
+    topology gives a CatchmentTopology of strings for each subarea, and table
+    a structured array of the same, one row per subarea in the order of the
+    runfile, with float coordinates and downstream as the row of the
+    downstream subarea, or SINK. Building the table raises ValueError if a
+    downstream subarea isn't in the topology. graph is the CatchmentGraph of the table.
+    """
 
+    block_name = 'TOPOLOGY_BLOCK'
     start_line = '#####START_TOPOLOGY_BLOCK##########|###########|###########|###########|'
     end_line = '#####END_TOPOLOGY_BLOCK############|###########|###########|###########|'
 
-    def __init__(self, runfile_contents):
-        super().__init__(runfile_contents)
+    def __init__(self, block_contents, sub_blocks=None):
+        super().__init__(block_contents, sub_blocks)
 
         self.num_subareas, self.catchment_name = re.search(re.compile('([0-9]+)\s*(.*)'), self.block_contents[0]).groups()
-        self.topology = {}
-        for catchment_topology_line in self.block_contents[1:]:
-            name = catchment_topology_line.split()[0]
-            self.topology[name] = CatchmentTopology(*catchment_topology_line.split())
+        self._topology = None
+        self._table = None
+        self._graph = None
+
+    @property
+    def topology(self):
+        if self._topology is None:
+            self._topology = {}
+            for catchment_topology_line in self.block_contents[1:]:
+                name = catchment_topology_line.split()[0]
+                self._topology[name] = CatchmentTopology(*catchment_topology_line.split())
+        return self._topology
+
+    @property
+    def table(self):
+        if self._table is None:
+            fields = np.array([line.split() for line in self.block_contents[1:]], dtype=str).reshape(-1, 6)
+            rows = {name: i for i, name in enumerate(fields[:, 0])}
+            rows[SINK_NAME] = SINK
+            unknown = sorted(set(fields[:, 5]) - set(rows))
+            if unknown:
+                raise ValueError(f'Downstream subareas not in the topology: {", ".join(unknown)}')
+            self._table = structured_table({
+                'name': fields[:, 0],
+                'cg_e': fields[:, 1].astype(float),
+                'cg_n': fields[:, 2].astype(float),
+                'outlet_e': fields[:, 3].astype(float),
+                'outlet_n': fields[:, 4].astype(float),
+                'downstream': np.array([rows[name] for name in fields[:, 5]], dtype=np.int64),
+            })
+        return self._table
+
+    @property
+    def graph(self):
+        """CatchmentGraph of the subareas, with ids of their rows in table."""
+        if self._graph is None:
+            self._graph = CatchmentGraph(self.table['name'], self.table['downstream'])
+        return self._graph
+
+
+class CatchmentGraph:
+    """Graph of subareas, each draining to one downstream subarea or the SINK.
+
+    Subareas are given as integer ids, their rows in TopologyBlock.table, and
+    ids maps their names to them. Everything is worked out once, in time
+    linear in the number of subareas:
+
+    - indptr and indices, the CSR adjacency of the subareas draining directly
+      to each subarea, those of subarea i being indices[indptr[i]:indptr[i + 1]]
+    - order, the subareas in topological order, each before the one it
+      drains to
+    - the subareas upstream of each subarea as a range of the preorder of
+      the catchment, so upstream() is a slice and accumulate() a difference
+      of cumulative sums
+
+    Args:
+        names (np.ndarray): name of each subarea.
+        downstream (np.ndarray): id of the subarea each subarea drains to,
+            or SINK.
+
+    Raises:
+        ValueError: if the subareas drain in a loop.
+    """
+
+    def __init__(self, names, downstream):
+        self.names = np.asarray(names)
+        self.downstream = np.asarray(downstream, dtype=np.int64)
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        num_subareas = len(self.downstream)
+
+        draining = np.flatnonzero(self.downstream != SINK)
+        inflow_counts = np.bincount(self.downstream[draining], minlength=num_subareas)
+        self.indptr = np.zeros(num_subareas + 1, dtype=np.int64)
+        np.cumsum(inflow_counts, out=self.indptr[1:])
+        self.indices = draining[np.argsort(self.downstream[draining], kind='stable')]
+
+        # Kahn's algorithm, starting from the headwater subareas
+        downstream_list = self.downstream.tolist()
+        remaining = inflow_counts.tolist()
+        order = np.flatnonzero(inflow_counts == 0).tolist()
+        for node in order:
+            next_node = downstream_list[node]
+            if next_node != SINK:
+                remaining[next_node] -= 1
+                if remaining[next_node] == 0:
+                    order.append(next_node)
+        if len(order) < num_subareas:
+            in_loop = sorted(set(range(num_subareas)) - set(order))
+            raise ValueError(f'Subareas drain in a loop: {", ".join(self.names[in_loop])}')
+        self.order = np.array(order, dtype=np.int64)
+
+        # number of subareas upstream of each, including itself
+        sizes = [1] * num_subareas
+        for node in order:
+            next_node = downstream_list[node]
+            if next_node != SINK:
+                sizes[next_node] += sizes[node]
+        # place each subarea in the preorder after the one it drains to,
+        # followed by everything upstream of it
+        starts = [0] * num_subareas
+        next_start = [0] * num_subareas
+        sink_start = 0
+        for node in reversed(order):
+            next_node = downstream_list[node]
+            if next_node == SINK:
+                starts[node] = sink_start
+                sink_start += sizes[node]
+            else:
+                starts[node] = next_start[next_node]
+                next_start[next_node] += sizes[node]
+            next_start[node] = starts[node] + 1
+        self.sizes = np.array(sizes, dtype=np.int64)
+        self.starts = np.array(starts, dtype=np.int64)
+        self.preorder = np.empty(num_subareas, dtype=np.int64)
+        self.preorder[self.starts] = np.arange(num_subareas)
+
+    def inflows(self, node):
+        """Subareas draining directly to a subarea."""
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def upstream(self, node):
+        """A subarea and every subarea upstream of it, as a view of the preorder."""
+        return self.preorder[self.starts[node]:self.starts[node] + self.sizes[node]]
+
+    def downstream_path(self, node):
+        """A subarea and every subarea downstream of it, down to the SINK."""
+        path = [node]
+        while self.downstream[path[-1]] != SINK:
+            path.append(self.downstream[path[-1]])
+        return np.array(path, dtype=np.int64)
+
+    def is_upstream(self, node, of):
+        """Whether a subarea is one of the subareas upstream of another, or is it."""
+        return self.starts[of] <= self.starts[node] < self.starts[of] + self.sizes[of]
+
+    def accumulate(self, values):
+        """Total of values over each subarea and everything upstream of it.
+
+        e.g. graph.accumulate(surfaces.table['area']) for the contributing
+        area at each subarea.
+
+        Args:
+            values (np.ndarray): value of each subarea.
+
+        Returns:
+            np.ndarray: accumulated value of each subarea.
+        """
+        totals = np.concatenate([[0], np.cumsum(np.asarray(values)[self.preorder])])
+        return totals[self.starts + self.sizes] - totals[self.starts]
 
 
 @dataclass
@@ -121,19 +494,54 @@ class CatchmentSurface:
 
 
 class SurfacesBlock(RunfileBlock):
+    """Area, impervious percentage and lag parameters of each subarea.
 
+    surfaces gives a CatchmentSurface of strings for each subarea, and table
+    a structured array of the same, one row per subarea with float columns.
+    """
+
+    block_name = 'SURFACES_BLOCK'
     start_line = '#####START_SURFACES_BLOCK##########|###########|###########|###########|'
     end_line = '#####END_SURFACES_BLOCK############|###########|###########|###########|'
 
-    def __init__(self, runfile_contents):
-        super().__init__(runfile_contents)
+    def __init__(self, block_contents, sub_blocks=None):
+        super().__init__(block_contents, sub_blocks)
 
         self.nonlinearity_exponent = self.block_contents[0]
-        self.discharge_when_routing_switches = self.block_contents[0]
-        self.surfaces = {}
-        for catchment_surface_line in self.block_contents[2:]:
-            name = catchment_surface_line.split()[0]
-            self.surfaces[name] = CatchmentSurface(*catchment_surface_line.split())
+        self.discharge_when_routing_switches = self.block_contents[1]
+        self._surfaces = None
+        self._table = None
+
+    @property
+    def surfaces(self):
+        if self._surfaces is None:
+            self._surfaces = {}
+            for catchment_surface_line in self.block_contents[2:]:
+                name = catchment_surface_line.split()[0]
+                self._surfaces[name] = CatchmentSurface(*catchment_surface_line.split())
+        return self._surfaces
+
+    @property
+    def table(self):
+        if self._table is None:
+            fields = np.array([line.split() for line in self.block_contents[2:]], dtype=str).reshape(-1, 5)
+            self._table = structured_table({
+                'name': fields[:, 0],
+                'area': fields[:, 1].astype(float),
+                'imp': fields[:, 2].astype(float),
+                'lag': fields[:, 3].astype(float),
+                'imp_lag': fields[:, 4].astype(float),
+            })
+        return self._table
+
+    @property
+    def total_area(self):
+        return self.table['area'].sum()
+
+    @property
+    def impervious_fraction(self):
+        """Impervious fraction of the whole catchment, weighted by area."""
+        return (self.table['area'] * self.table['imp']).sum() / 100 / self.total_area
 
 
 @dataclass
@@ -147,7 +555,14 @@ class CatchmentFlowpath:
 
 
 class FlowpathsBlock(RunfileBlock):
+    """Routing of the stream of each subarea that has one.
+
+    flowpaths gives a CatchmentFlowpath of strings for each stream, and table
+    a structured array of the same, one row per stream with float columns,
+    NaN where a value doesn't apply to its routing type.
+    """
 
+    block_name = 'FLOWPATHS_BLOCK'
     start_line = '#####START_FLOWPATHS_BLOCK#########|###########|###########|###########|'
     end_line = '#####END_FLOWPATHS_BLOCK###########|###########|###########|###########|'
 
@@ -157,26 +572,70 @@ class FlowpathsBlock(RunfileBlock):
         '#####MUSK': 'musk',
     }
 
-    def __init__(self, runfile_contents):
-        super().__init__(runfile_contents)
+    def __init__(self, block_contents, sub_blocks=None):
+        super().__init__(block_contents, sub_blocks)
 
         self.num_subareas_with_stream = self.block_contents[0]
-        self.flowpaths = {}
-        for name, routing_line, value in grouper(3, self.block_contents[1:]):
-            name = name.strip()
-            routing_type = self.routing_types[routing_line.strip()]
-            if routing_type == 'routing':
-                stream_lag = value.strip()
-                self.flowpaths[name] = CatchmentFlowpath(name, routing_type, stream_lag=stream_lag)
-            elif routing_type == 'delay':
-                delay = value.strip()
-                self.flowpaths[name] = CatchmentFlowpath(name, routing_type, delay=delay)
-            elif routing_type == 'musk':
-                musk_k, musk_x = value.strip().split()
-                self.flowpaths[name] = CatchmentFlowpath(name, routing_type, musk_k=musk_k, musk_x=musk_x)
-
-
-class LocalStructure(RunfileBlock):
+        self._flowpaths = None
+        self._table = None
+
+    @property
+    def flowpaths(self):
+        if self._flowpaths is None:
+            self._flowpaths = {}
+            for name, routing_line, value in grouper(3, self.block_contents[1:]):
+                name = name.strip()
+                routing_type = self.routing_types[routing_line.strip()]
+                if routing_type == 'routing':
+                    stream_lag = value.strip()
+                    self._flowpaths[name] = CatchmentFlowpath(name, routing_type, stream_lag=stream_lag)
+                elif routing_type == 'delay':
+                    delay = value.strip()
+                    self._flowpaths[name] = CatchmentFlowpath(name, routing_type, delay=delay)
+                elif routing_type == 'musk':
+                    musk_k, musk_x = value.strip().split()
+                    self._flowpaths[name] = CatchmentFlowpath(name, routing_type, musk_k=musk_k, musk_x=musk_x)
+        return self._flowpaths
+
+    @property
+    def table(self):
+        if self._table is None:
+            lines = self.block_contents[1:]
+            names = np.array([line.strip() for line in lines[0::3]], dtype=str)
+            routing_types = np.array([self.routing_types[line.strip()] for line in lines[1::3]], dtype=str)
+            values = np.full((len(names), 4), np.nan)
+            columns = {'routing': [0], 'delay': [1], 'musk': [2, 3]}
+            for i, (routing_type, line) in enumerate(zip(routing_types, lines[2::3])):
+                values[i, columns[routing_type]] = line.split()
+            self._table = structured_table({
+                'name': names,
+                'routing_type': routing_types,
+                'stream_lag': values[:, 0],
+                'delay': values[:, 1],
+                'musk_k': values[:, 2],
+                'musk_x': values[:, 3],
+            })
+        return self._table
+
+
+@dataclass
+class StructureOutlet:
+    outlet_type: str
+    contents: list
+    number: Optional[float] = None
+    downstream_sub_name: Optional[str] = None
+    position: Optional[str] = None
+    stream_lag: Optional[float] = None
+
+
+class Structure(RunfileBlock):
+    """A storage basin and its outlets, on a subarea.
+
+    The H-S-Q table of the basin is kept as a 2-D float array, hsq, with
+    columns of elevation, storage and then the discharge of each outlet.
+    """
+
+    structure_name = 'STRUCTURE'
 
     structure_types = {
         '#####H_S_Q': 'hsq',
@@ -187,38 +646,239 @@ class LocalStructure(RunfileBlock):
     }
 
     outlet_types = {
+        '#####HSQ': 'hsq',
         '#####BOX': 'box',
         '#####PIPE': 'pipe',
         '#####WEIR': 'weir',
         '#####SCOUR': 'scour',
     }
 
-    def __init__(self, local_structure_block_contents, local_structure_no):
+    def __init__(self, block_contents, structure_no, sub_blocks=None):
 
-        self.start_line = f'#####START_LOCAL_STRUCTURE#{local_structure_no}'
-        self.end_line = f'#####END_LOCAL_STRUCTURE#{local_structure_no}'
+        self.block_name = f'{self.structure_name}#{structure_no}'
+        self.start_line = f'#####START_{self.structure_name}#{structure_no}'
+        self.end_line = f'#####END_{self.structure_name}#{structure_no}'
 
-        super().__init__(local_structure_block_contents)
+        super().__init__(block_contents, sub_blocks)
         self.description = self.block_contents[0].strip()
         self.subarea_name = self.block_contents[1].strip()
-        self.structure_type = self.structure_types[self.block_contents[0].strip().split()[1]]
+        self.structure_type = self.structure_types[self.block_contents[2].strip()]
+
+        outlet_details = self.sub_block('OUTLET_DETAILS')
+        self.outlets = [
+            self.outlet(entry)
+            for entry in split_entries(outlet_details[1:], lambda line: line.startswith('#####'))]
 
-        if self.structure_type
+        basin_details = self.sub_block('BASIN_DETAILS')
+        num_levels = int(basin_details[0])
+        self.hsq = float_table(basin_details[1:num_levels + 1])
+        self.initial_water_level = float(basin_details[num_levels + 1])
+        self.basin_parameters = np.array(basin_details[num_levels + 2:], dtype=float)
 
+    def outlet(self, entry):
+        """Parse the lines of one outlet, starting with its type line."""
+        outlet_type = self.outlet_types[entry[0].strip()]
+        contents = [line.strip() for line in entry[1:]]
+        if outlet_type == 'hsq':
+            # discharges of H-S-Q outlets are given in the basin's table
+            number, downstream_sub_name, position, stream_lag = contents
+            return StructureOutlet(
+                outlet_type, contents, number=float(number), downstream_sub_name=downstream_sub_name,
+                position=position, stream_lag=float(stream_lag))
+        return StructureOutlet(outlet_type, contents)
 
-class LocalStructuresBlock(RunfileBlock):
+    @property
+    def elevation(self):
+        return self.hsq[:, 0]
 
+    @property
+    def storage(self):
+        return self.hsq[:, 1]
+
+    @property
+    def discharge(self):
+        """Discharge of each outlet at each elevation, one column per outlet."""
+        return self.hsq[:, 2:]
+
+
+class LocalStructure(Structure):
+
+    structure_name = 'LOCAL_STRUCTURE'
+
+
+class OutletStructure(Structure):
+
+    structure_name = 'OUTLET_STRUCTURE'
+
+
+class StructuresBlock(RunfileBlock):
+    """Block of the structures of a runfile, keyed by their number."""
+
+    structure_class = Structure
+
+    def __init__(self, block_contents, sub_blocks=None):
+        super().__init__(block_contents, sub_blocks)
+
+        self.structures = {}
+        self.num_structures = self.block_contents[0]
+
+        for n in range(1, int(self.num_structures) + 1):
+            name = f'{self.structure_class.structure_name}#{n}'
+            self.structures[n] = self.structure_class(
+                self.sub_block(name), n, self.sub_block_spans(name))
+
+
+class LocalStructuresBlock(StructuresBlock):
+
+    block_name = 'LOCAL_STRUCTURES_BLOCK'
     start_line = '#####START_LOCAL_STRUCTURES_BLOCK##|###########|###########|###########|'
     end_line = '#####END_LOCAL_STRUCTURES_BLOCK####|###########|###########|###########|'
 
-    def __init__(self, runfile_contents):
-        super().__init__(runfile_contents)
+    structure_class = LocalStructure
 
-        self.structures = {}
-        self.num_subareas_with_local_structure = self.block_contents[0]
+    def __init__(self, block_contents, sub_blocks=None):
+        super().__init__(block_contents, sub_blocks)
+        self.num_subareas_with_local_structure = self.num_structures
+
+
+class OutletStructuresBlock(StructuresBlock):
+
+    block_name = 'OUTLET_STRUCTURES_BLOCK'
+    start_line = '#####START_OUTLET_STRUCTURES_BLOCK#|###########|###########|###########|'
+    end_line = '#####END_OUTLET_STRUCTURES_BLOCK###|###########|###########|###########|'
+
+    structure_class = OutletStructure
+
+    def __init__(self, block_contents, sub_blocks=None):
+        super().__init__(block_contents, sub_blocks)
+        self.num_subareas_with_outlet_structure = self.num_structures
+
+
+class DesignRain(RunfileBlock):
+    """Design rainfall of a storm, e.g. from a DESIGN_RAIN_ARR2016 block.
+
+    The header gives the AEP, duration and pattern to run, with -1 for all
+    of them, and for ARR2016 the subarea used for areal adjustments. The
+    data sources follow, each a keyword such as IFD_DATA_IN_GAUGE_FILES then
+    its values, kept in sources as a float array where the values are all
+    numbers, e.g. temporal patterns given in the runfile, and otherwise as
+    strings, e.g. file names.
+    """
+
+    source_line = re.compile('^[A-Z0-9]+_DATA_IN_[A-Z_]+$')
+
+    def __init__(self, block_contents, block_name, sub_blocks=None):
+
+        self.block_name = block_name
+        self.start_line = f'#####START_{block_name}'
+        self.end_line = '#####END_DESIGN_RAIN_ARR'
+
+        super().__init__(block_contents, sub_blocks)
+        header = self.block_contents[0].split()
+        self.parameters = np.array(header[:4], dtype=float)
+        self.aep, self.duration, self.pattern = self.parameters[:3]
+        self.subarea_name = header[4] if len(header) > 4 else None
+
+        self.sources = {}
+        for entry in split_entries(self.block_contents[1:], lambda line: self.source_line.match(line.strip())):
+            self.sources[entry[0].strip()] = float_table_or_lines(entry[1:])
+
+    @property
+    def ifd_gauges(self):
+        """Names of the IFD gauge files, after their count."""
+        return self.sources.get('IFD_DATA_IN_GAUGE_FILES', ['0'])[1:]
+
+
+class LossRates(RunfileBlock):
+    """Loss model of a storm, e.g. ARRLOSSES, and its values.
+
+    The values are kept as a float array, or as their lines if they aren't
+    a table of numbers.
+    """
+
+    block_name = 'LOSS_RATES'
+    start_line = '#####START_LOSS_RATES'
+    end_line = '#####END_LOSS_RATES'
+
+    def __init__(self, block_contents, sub_blocks=None):
+        super().__init__(block_contents, sub_blocks)
+        self.loss_type = self.block_contents[0].strip() if self.block_contents else None
+        self.values = float_table_or_lines(self.block_contents[1:])
+
+
+@dataclass
+class RecordedHydrograph:
+    subarea_name: str
+    values: np.ndarray
+
+
+class RecordedHydrographsBlock(RunfileBlock):
+    """Recorded hydrographs of a storm, each a subarea name then rows of numbers.
+
+    The rows of each are kept as a float array, or as their lines if they
+    aren't a table of numbers, e.g. rows of different lengths.
+    """
+
+    block_name = 'RECORDED_HYDROGRAPHS'
+    start_line = '#####START_RECORDED_HYDROGRAPHS'
+    end_line = '#####END_RECORDED_HYDROGRAPHS'
+
+    def __init__(self, block_contents, sub_blocks=None):
+        super().__init__(block_contents, sub_blocks)
+        self.num_hydrographs = self.block_contents[0] if self.block_contents else '0'
+        self.hydrographs = {}
+        for entry in split_entries(self.block_contents[1:], lambda line: not is_number_line(line)):
+            name = entry[0].strip()
+            self.hydrographs[name] = RecordedHydrograph(name, float_table_or_lines(entry[1:]))
+
+
+class Storm(RunfileBlock):
+    """A storm, with its rainfall, losses and any recorded hydrographs.
+
+    Rainfall other than design rainfall, e.g. recorded rainfall, is kept as
+    the lines of its block.
+    """
+
+    rain_prefixes = ('DESIGN_RAIN', 'RECORDED_RAIN')
+
+    def __init__(self, block_contents, storm_no, sub_blocks=None):
+
+        self.block_name = f'STORM#{storm_no}'
+        self.start_line = f'#####START_STORM#{storm_no}'
+        self.end_line = f'#####END_STORM#{storm_no}'
+
+        super().__init__(block_contents, sub_blocks)
+        self.description = self.block_contents[0].strip()
+        self.time_steps = np.array(self.block_contents[1:3], dtype=float)
+
+        rain_types = [path[0] for path in self.sub_blocks if len(path) == 1 and path[0].startswith(self.rain_prefixes)]
+        self.rain_type = rain_types[0] if rain_types else None
+        if self.rain_type is None:
+            self.rain = None
+        elif self.rain_type.startswith('DESIGN_RAIN'):
+            self.rain = DesignRain(self.sub_block(self.rain_type), self.rain_type)
+        else:
+            self.rain = RunfileBlock(self.sub_block(self.rain_type))
+
+        self.loss_rates = LossRates(self.sub_block('LOSS_RATES'))
+        self.recorded_hydrographs = RecordedHydrographsBlock(self.sub_block('RECORDED_HYDROGRAPHS'))
+
+
+class StormBlock(RunfileBlock):
+
+    block_name = 'STORM_BLOCK'
+    start_line = '#####START_STORM_BLOCK#############|###########|###########|###########|'
+    end_line = '#####END_STORM_BLOCK###############|###########|###########|###########|'
+
+    def __init__(self, block_contents, sub_blocks=None):
+        super().__init__(block_contents, sub_blocks)
+
+        self.storms = {}
+        self.num_storms = self.block_contents[0]
 
-        for n in range(1, self.num_subareas_with_local_structure + 1):
-            self.structures[n] = LocalStructure(self.block_contents, n)
+        for n in range(1, int(self.num_storms) + 1):
+            name = f'STORM#{n}'
+            self.storms[n] = Storm(self.sub_block(name), n, self.sub_block_spans(name))
 
 
 if __name__ == "__main__":
@@ -27,18 +27,19 @@ from qgis.PyQt.QtWidgets import (
     QAction,
     QFileDialog,
     QProgressBar,
+    QPushButton,
     QVBoxLayout,
     QWidget,
     QMenuBar,
 )
-from qgis.core import Qgis
+from qgis.core import Qgis, QgsApplication
 from qgis.gui import QgsMessageBar
 
 from matplotlib.backends.backend_qt5agg import (
     FigureCanvasQTAgg as FigureCanvas,
     NavigationToolbar2QT as NavigationToolbar,
 )
-import fnmatch
+import numpy as np
 
 # Initialize Qt resources from file resources.py
 from .resources import *
@@ -47,9 +48,10 @@ from .resources import *
 from .wbnm_viewer_dockwidget import WBNMViewerDockWidget
 import os.path
 
-from .wbnm_plot import single_hydrograph, box_plot, ensembles, update_plot
-from .wbnm_results_parser import get_hydrographs, get_peaks
+from .wbnm_plot import PlotController, single_hydrograph, box_plot, ensembles
+from .wbnm_results_task import MetaFileTask
 from .data_frame_model import DataFrameModel
+from .list_model import ListModel, StormListModel
 
 
 class WBNMViewer:
@@ -93,9 +95,19 @@ class WBNMViewer:
 
         # store processed data
         self.peaks = []
+        self.indexed_peaks = []
+        self.summaries = []
         self.hydrographs = []
         self.subareas = []
         self.storms = []
+        self.subarea_model = None
+        self.storm_model = None
+        self.aep_model = None
+        self.duration_model = None
+        self.hydrograph_plot = None
+        self.box_whisker_plot = None
+        self.ensemble_plot = None
+        self.task = None
 
     # noinspection PyMethodMayBeStatic
     def tr(self, message):
@@ -235,96 +247,137 @@ class WBNMViewer:
     def populate_lists(self):
         processed_peaks = self.peaks[0]
 
-        self.subareas = processed_peaks.subarea.sort_values().unique()
-        self.storms = processed_peaks["storm"].sort_values().unique()
-        self.aeps = processed_peaks["aep"].sort_values().unique()
-        self.durations = processed_peaks["dur"].sort_values().unique()
-
-        self.dockwidget.subareasListWidget.addItems(self.subareas)
-        self.dockwidget.subareas2ListWidget.addItems(self.subareas)
-        self.dockwidget.subareas3ListWidget.addItems(self.subareas)
-        self.dockwidget.stormsListWidget.addItems(self.storms)
-        self.dockwidget.aepsListWidget.addItems(sorted(self.aeps, key=lambda x: float(x)))
-        self.dockwidget.aeps2ListWidget.addItems(sorted(self.aeps, key=lambda x: float(x)))
-        self.dockwidget.durationsListWidget.addItems(sorted(self.durations, key=lambda x: int(x)))
+        # categories of the peaks table are already sorted
+        self.subareas = list(processed_peaks.subarea.cat.categories)
+        self.storms = list(processed_peaks.storm.cat.categories)
+        self.aeps = np.sort(processed_peaks.aep.unique()).tolist()
+        self.durations = np.sort(processed_peaks.dur.unique()).tolist()
+
+        # each model is shared by the list views of every tab that shows it
+        self.subarea_model.setItems(self.subareas)
+        self.storm_model.setStorms(self.storms)
+        self.filter_storms()
+        self.aep_model.setItems(["{:g}".format(aep) for aep in self.aeps], self.aeps)
+        self.duration_model.setItems(
+            ["{:g}".format(dur) for dur in self.durations], self.durations
+        )
 
     def process_meta_file(self):
         meta_file = self.select_meta_file()
         if meta_file:
-            # process peaks
-            processed_peaks = get_peaks(meta_file)
-            self.peaks.append(processed_peaks)
-            self.populate_lists()
-
-            self.iface.messageBar().pushSuccess(
-                "Success", "Meta file processed successfully!"
-            )
-
-            # process hydrographs
             progressMessageBar = self.iface.messageBar().createMessage(
-                "Processing hydrographs..."
+                "Processing meta file..."
             )
             progress = QProgressBar()
-            progress.setMaximum(len(self.peaks[0]["storm"].sort_values().unique()))
+            progress.setMaximum(100)
             progress.setAlignment(Qt.AlignLeft | Qt.AlignVCenter)
             progressMessageBar.layout().addWidget(progress)
+            cancelButton = QPushButton("Cancel")
+            progressMessageBar.layout().addWidget(cancelButton)
             self.iface.messageBar().pushWidget(progressMessageBar, Qgis.Info)
 
-            processed_hydrographs = get_hydrographs(meta_file, progress=progress)
-            self.hydrographs.append(processed_hydrographs)
+            # process peaks and index hydrographs in the background, the
+            # hydrographs are read when plotted
+            # each task's handlers are given that task and its progress bar,
+            # as another file may be loaded before it finishes
+            task = MetaFileTask(meta_file)
+            task.progressChanged.connect(lambda value: progress.setValue(int(value)))
+            task.taskCompleted.connect(lambda: self.load_results(task, progressMessageBar))
+            task.taskTerminated.connect(lambda: self.load_failed(task, progressMessageBar))
+            cancelButton.clicked.connect(task.cancel)
+            self.task = task
+            QgsApplication.taskManager().addTask(task)
+
+    def load_results(self, task, message):
+        self.peaks.append(task.peaks)
+        self.indexed_peaks.append(task.indexed_peaks)
+        self.summaries.append(task.summary)
+        self.hydrographs.append(task.hydrographs)
+        self.populate_lists()
+
+        self.iface.messageBar().popWidget(message)
+        self.iface.messageBar().pushSuccess(
+            "Success", "Meta file processed successfully!"
+        )
 
-            self.iface.messageBar().clearWidgets()
-            self.iface.messageBar().pushSuccess(
-                "Success", "Hydrographs processed successfully!"
-            )
+        model = DataFrameModel(self.peaks[0])
+        self.dockwidget.dataTableView.setModel(model)
 
-            model = DataFrameModel(self.peaks[0])
-            self.dockwidget.dataTableView.setModel(model)
+    def load_failed(self, task, message):
+        self.iface.messageBar().popWidget(message)
+        if task.exception:
+            self.iface.messageBar().pushCritical(
+                "Error", "Meta file could not be processed: {}".format(task.exception)
+            )
+        else:
+            self.iface.messageBar().pushWarning(
+                "Cancelled", "Meta file processing was cancelled."
+            )
 
     def plot_hydrograph(self):
-        subarea = self.dockwidget.subareasListWidget.selectedItems()[0].text()
-        storm = self.dockwidget.stormsListWidget.selectedItems()[0].text()
+        subarea = self.dockwidget.subareasListView.selectedIndexes()[0].data()
+        storm = self.dockwidget.stormsListView.selectedIndexes()[0].data()
 
-        time = self.hydrographs[0][subarea][storm]["Time"]
-        flow = self.hydrographs[0][subarea][storm]["Qout_OS"]
-        fig = single_hydrograph(time, flow)
-        update_plot(fig, self.dockwidget.chartWidget)
+        time = self.hydrographs[0].column(subarea, storm, "Time")
+        flow = self.hydrographs[0].column(subarea, storm, "Qout_OS")
+        single_hydrograph(self.hydrograph_plot, time, flow)
 
     def plot_box_whisker(self):
-        subarea = self.dockwidget.subareas2ListWidget.selectedItems()[0].text()
-        aep = self.dockwidget.aepsListWidget.selectedItems()[0].text()
+        subarea = self.dockwidget.subareas2ListView.selectedIndexes()[0].data()
+        aep = self.dockwidget.aepsListView.selectedIndexes()[0].data(
+            ListModel.KeyRole
+        )
 
-        fig = box_plot(subarea, aep, self.peaks[0])
-        update_plot(fig, self.dockwidget.boxWidget)
+        if not box_plot(self.box_whisker_plot, subarea, aep, self.summaries[0]):
+            self.no_storms_warning(subarea, aep)
 
     def plot_ensembles(self):
-        subarea = self.dockwidget.subareas3ListWidget.selectedItems()[0].text()
-        aep = self.dockwidget.aeps2ListWidget.selectedItems()[0].text()
-        duration = self.dockwidget.durationsListWidget.selectedItems()[0].text()
+        subarea = self.dockwidget.subareas3ListView.selectedIndexes()[0].data()
+        aep = self.dockwidget.aeps2ListView.selectedIndexes()[0].data(
+            ListModel.KeyRole
+        )
+        duration = self.dockwidget.durationsListView.selectedIndexes()[0].data(
+            ListModel.KeyRole
+        )
 
-        storms = self.peaks[0].loc[
-            (self.peaks[0].subarea == subarea) &
-            (self.peaks[0].aep == aep) &
-            (self.peaks[0].dur == duration)
-        ].storm.unique()
+        # the AEP and duration lists hold those of every subarea, so not every
+        # combination was run
+        key = (subarea, "out", aep, duration)
+        if key in self.indexed_peaks[0].index:
+            storms = self.indexed_peaks[0].loc[key, "storm"].unique()
+        else:
+            storms = []
+            self.no_storms_warning(subarea, aep, duration)
 
         times = []
         flows = []
         for storm in storms:
-            times.append(self.hydrographs[0][subarea][storm]["Time"])
-            flows.append(self.hydrographs[0][subarea][storm]["Qout_OS"])
+            times.append(self.hydrographs[0].column(subarea, storm, "Time"))
+            flows.append(self.hydrographs[0].column(subarea, storm, "Qout_OS"))
+
+        ensembles(self.ensemble_plot, times, flows, storms)
 
-        fig = ensembles(times, flows, storms)
-        update_plot(fig, self.dockwidget.ensembleWidget)
+    def no_storms_warning(self, subarea, aep, duration=None):
+        selection = "{}, {:g}% AEP".format(subarea, aep)
+        if duration is not None:
+            selection += ", {:g} minutes".format(duration)
+        self.iface.messageBar().pushWarning(
+            "No storms", "No storms were run for {}.".format(selection)
+        )
+
+    def filter_peaks(self):
+        model = self.dockwidget.dataTableView.model()
+        if model is None:
+            return
+        try:
+            model.setFilter(self.dockwidget.dataFilterEdit.text())
+        except Exception as e:
+            self.iface.messageBar().pushWarning(
+                "Filter", "Peaks filter could not be applied: {}".format(e)
+            )
 
     def filter_storms(self):
-        self.dockwidget.stormsListWidget.clear()
-        filter_text = self.dockwidget.filterEdit.text()
-        if filter_text == "":
-            self.dockwidget.stormsListWidget.addItems(self.storms)
-        else:
-            filtered_storms = fnmatch.filter(self.storms, "*" + filter_text + "*")
-            self.dockwidget.stormsListWidget.addItems(filtered_storms)
+        self.storm_model.setFilter(self.dockwidget.filterEdit.text())
 
     def run(self):
         """Run method that loads and starts the plugin"""
@@ -340,8 +393,25 @@ class WBNMViewer:
             if self.dockwidget == None:
                 # Create the dockwidget (after translation) and keep reference
                 self.dockwidget = WBNMViewerDockWidget()
+                self.subarea_model = ListModel()
+                self.storm_model = StormListModel()
+                self.aep_model = ListModel()
+                self.duration_model = ListModel()
+                self.dockwidget.subareasListView.setModel(self.subarea_model)
+                self.dockwidget.subareas2ListView.setModel(self.subarea_model)
+                self.dockwidget.subareas3ListView.setModel(self.subarea_model)
+                self.dockwidget.stormsListView.setModel(self.storm_model)
+                self.dockwidget.aepsListView.setModel(self.aep_model)
+                self.dockwidget.aeps2ListView.setModel(self.aep_model)
+                self.dockwidget.durationsListView.setModel(self.duration_model)
+                self.hydrograph_plot = PlotController(self.dockwidget.chartWidget)
+                self.box_whisker_plot = PlotController(
+                    self.dockwidget.boxWidget, xlabel="Storm duration, minutes"
+                )
+                self.ensemble_plot = PlotController(self.dockwidget.ensembleWidget)
                 self.dockwidget.plotButton.clicked.connect(self.plot_hydrograph)
                 self.dockwidget.filterEdit.textChanged.connect(self.filter_storms)
+                self.dockwidget.dataFilterEdit.returnPressed.connect(self.filter_peaks)
                 self.dockwidget.boxButton.clicked.connect(self.plot_box_whisker)
                 self.dockwidget.ensembleButton.clicked.connect(self.plot_ensembles)
 